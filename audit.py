@@ -0,0 +1,126 @@
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from pathlib import Path
+import config
+
+# Order state changes, one JSON object per line, e.g.
+#   {"ts": "2024-01-02T15:04:05.123+00:00", "event": "submitted", "order": "M-1234", "supplier": "meyer",
+#    "mode": "live", "supplier_order_ids": ["5501234"]}
+# Events: 'submitted' (the supplier took the order), 'failed' (it needs a person, with the reason) and
+# 'tracked' (tracking was applied).
+logger = logging.getLogger('process-dropships.audit')
+logger.propagate = False
+
+__listeners = []
+
+
+def compress(source, dest):
+    # Rotator for the handlers below: the rotated file is gzipped into dest
+    if not os.path.exists(source):
+        return
+
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class RotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates once the file reaches max_bytes or every rotate_seconds (on UTC boundaries, so 86400 is at midnight
+    UTC), whichever comes first. Rotated files are gzip-compressed, newest first: audit.jsonl.1.gz, .2.gz, ...
+    """
+
+    def __init__(self, filename, max_bytes=0, rotate_seconds=0, backups=0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = compress
+        self.rotate_seconds = rotate_seconds
+
+        # A file left over from an earlier run is rotated if it's from an earlier period
+        last_written = os.path.getmtime(filename) if os.path.exists(filename) else time.time()
+        self.__rollover_at = self.__next_rollover(last_written)
+
+    def __next_rollover(self, now):
+        if not self.rotate_seconds:
+            return None
+        return (now // self.rotate_seconds + 1) * self.rotate_seconds
+
+    def shouldRollover(self, record):
+        if self.__rollover_at is not None and time.time() >= self.__rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.__rollover_at = self.__next_rollover(time.time())
+
+
+class JSONFormatter(logging.Formatter):
+    """Writes the event an audit record carries (see event()) as one line of JSON."""
+
+    def format(self, record):
+        return json.dumps(record.audit, default=str)
+
+
+def queued(handler):
+    # A handler that only puts records on a queue. A listener thread hands them on to 'handler', so writing,
+    # rotating and compressing never hold up the thread that logged.
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+
+    if not __listeners:
+        atexit.register(stop)
+    __listeners.append(listener)
+
+    return logging.handlers.QueueHandler(records)
+
+
+def shard_file(filename):
+    # Shards each keep their own files, so no two processes append to (or rotate) the same one
+    path = Path(filename)
+    if config.shard_count > 1:
+        path = path.with_name(f"{path.stem}-shard{config.shard_index}{path.suffix}")
+    return str(path)
+
+
+def start():
+    if not config.audit_log or logger.handlers:
+        return
+
+    handler = RotatingFileHandler(
+        shard_file(config.audit_log), config.audit_log_max_bytes, config.audit_log_rotate_seconds,
+        config.audit_log_backups)
+    handler.setFormatter(JSONFormatter())
+
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queued(handler))
+
+
+def stop():
+    # Writes out whatever is still queued
+    while __listeners:
+        __listeners.pop().stop()
+
+
+def event(kind, order_number, supplier, **fields):
+    # Queues one audit line and returns straight away. Does nothing unless start() has been called, or when the
+    # run is a replay (http_traffic), since nothing it does happens to a real order.
+    if not logger.handlers or config.http_traffic == 'replay':
+        return
+
+    logger.info(kind, extra={'audit': {
+        'ts': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+        'event': kind,
+        'order': order_number,
+        'supplier': supplier,
+        'mode': 'test' if config.test else 'live',
+        **fields}})
@@ -0,0 +1,112 @@
+"""
+Drives the submit and tracking phases against the local mocks for synthetic backlogs and reports throughput.
+
+    python bench/bench_pipeline.py --orders 10 100 1000 --latency 0.02 --concurrency 8
+
+Reports orders/sec, p50/p99 time per order and upstream calls per order for each phase and backlog size.
+Nothing here talks to the live APIs.
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import mocks
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, nargs='+', default=[10, 100, 1000], help="backlog sizes to run")
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds each mock call takes")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of mock calls answered with a 503")
+    parser.add_argument('--kit-depth', type=int, default=1, help="levels of kits inside kits (0 for no kits)")
+    parser.add_argument('--concurrency', type=int, default=1, help="orders processed at once per supplier")
+    parser.add_argument('--engine', action='store_true', help="run every supplier's phases at once (use_engine)")
+    parser.add_argument('--combined', action='store_true', help="list each tag's orders once for both suppliers")
+    parser.add_argument('--index', action='store_true', help="expand kits from the local product index")
+    parser.add_argument('--rate', type=float, default=10000, help="per-upstream rate limit (calls/sec)")
+    parser.add_argument('--verbose', action='store_true', help="show the pipeline's own log output")
+    args = parser.parse_args()
+
+    upstreams = mocks.Upstreams(latency=args.latency, error_rate=args.error_rate, kit_depth=args.kit_depth)
+    server = mocks.start(upstreams)
+    workdir = tempfile.TemporaryDirectory(prefix='dropships-bench-')
+
+    mocks.load_config(
+        f"http://127.0.0.1:{server.server_address[1]}",
+        taw_concurrency=args.concurrency,
+        meyer_concurrency=args.concurrency,
+        http_pool_size=max(args.concurrency * 2, 10),
+        http_rate_limits={'ordoro': args.rate, 'taw': args.rate, 'meyer': args.rate},
+        http_backoff=0.01,
+        use_engine=args.engine,
+        state_db=str(Path(workdir.name) / 'state.db'),
+        product_cache_db=None,
+        product_index=args.index,
+        combined_fetch=args.combined,
+        track_poll_min=0,
+        metrics_file=None)
+
+    import metrics
+    import ordoro
+    import pipeline
+    import suppliers
+
+    suppliers.load()
+
+    logger = logging.getLogger('process-dropships')
+    logger.setLevel(logging.INFO)
+    if args.verbose:
+        logger.addHandler(logging.StreamHandler())
+    else:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+
+    # Keep every per-order duration, not just the histogram, so percentiles are exact
+    samples = dict()
+    record_order = metrics.record_order
+
+    def keep_sample(seconds, error=False):
+        samples.setdefault(metrics.current_phase.get().split('.')[1], []).append(seconds)
+        record_order(seconds, error)
+
+    metrics.record_order = keep_sample
+
+    print(f"latency={args.latency}s error_rate={args.error_rate} kit_depth={args.kit_depth} "
+          f"concurrency={args.concurrency} engine={args.engine} index={args.index} "
+          f"combined={args.combined}")
+    print(f"{'orders':>7} {'phase':>7} {'orders/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'calls/order':>12}")
+
+    for run, num_orders in enumerate(args.orders):
+        upstreams.add_orders(num_orders, prefix=f"BENCH{run}")
+        ordoro.get_product_cache().clear()
+
+        for phase in ['submit', 'track']:
+            samples.clear()
+            upstreams.reset_calls()
+
+            started = time.perf_counter()
+            pipeline.run(phase == 'submit', phase == 'track')
+            elapsed = time.perf_counter() - started
+
+            durations = samples.get(phase, [])
+            print(f"{num_orders:>7} {phase:>7} {num_orders / elapsed:>10.1f} "
+                  f"{percentile(durations, 50) * 1000:>9.1f} {percentile(durations, 99) * 1000:>9.1f} "
+                  f"{upstreams.total_calls() / max(num_orders, 1):>12.2f}")
+
+    server.shutdown()
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures cold start: how long a fresh interpreter takes to import process-dropships, and then to get the
+first answer back from Ordoro (the Dropship Ready listing) against the local mocks.
+
+    python bench/bench_startup.py --runs 10
+
+Every run is a new subprocess, so nothing is already imported or cached. Reports the median and worst of each.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import mocks
+
+# What each child process runs: config pointed at the mocks (not timed, the mocks pull in http.server and more),
+# then the same imports a scheduled run starts with, then the first Dropship Ready page
+child = """
+import importlib.util, json, sys, time
+sys.path.insert(0, {bench_dir!r})
+import mocks
+mocks.load_config({base_url!r}, product_cache_db=None, metrics_file=None)
+already_loaded = len(sys.modules)
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('process_dropships', {script!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+imported = time.perf_counter()
+modules = len(sys.modules) - already_loaded
+import ordoro
+next(ordoro.get_dropship_ready_orders(), None)
+answered = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'first_request': answered - imported,
+                  'modules': modules}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help="fresh processes to start")
+    parser.add_argument('--orders', type=int, default=10, help="orders waiting in the mock backlog")
+    args = parser.parse_args()
+
+    upstreams = mocks.Upstreams()
+    upstreams.add_orders(args.orders)
+    server = mocks.start(upstreams)
+
+    code = child.format(
+        bench_dir=str(Path(__file__).resolve().parent),
+        base_url=f"http://127.0.0.1:{server.server_address[1]}",
+        script=str(mocks.repo_dir / 'process-dropships.py'))
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.splitlines()[-1]))
+
+    print(f"{'':>14} {'median ms':>10} {'max ms':>10}")
+    for key in ['import', 'first_request']:
+        samples = [result[key] for result in results]
+        print(f"{key:>14} {statistics.median(samples) * 1000:>10.1f} {max(samples) * 1000:>10.1f}")
+    print(f"modules loaded by the import: {results[-1]['modules']}")
+    print(f"Ordoro calls per run: {upstreams.total_calls() / args.runs:.1f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of the TAW order XML serializer against the f-string concatenation it replaced, for orders
+whose kits expand into many parts.
+
+    python bench/bench_taw_xml.py --parts 10 100 1000 10000
+"""
+import argparse
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import order_model
+import taw_xml
+
+
+def concat_order_xml(parsed_order):
+    # The previous taw.submit_dropships construction, kept verbatim for comparison
+    xml_pt1 = f"""<?xml version='1.0' ?>
+            <Order>
+                <PONumber>{parsed_order['PONumber']}</PONumber>
+                <ReqDate>{parsed_order['ReqDate']}</ReqDate>
+                <ShipTo>
+                    <Name>{parsed_order['ShipTo']['Name']}</Name>
+                    <Address>{parsed_order['ShipTo']['Address1']}</Address>
+                    <Address>{parsed_order['ShipTo']['Address2']}</Address>
+                    <City>{parsed_order['ShipTo']['City']}</City>
+                    <State>{parsed_order['ShipTo']['State']}</State>
+                    <Zip>{parsed_order['ShipTo']['Zip']}</Zip>
+                    <Country>{parsed_order['ShipTo']['Country']}</Country>
+                </ShipTo>
+    """
+
+    xml_pt2 = ""
+
+    for eachPart in parsed_order['Parts']:
+        partno = eachPart['PartNo']
+        qty = eachPart['Qty']
+        xml_pt2 = f"{xml_pt2}<Part Number='{partno}'><Qty>{qty}</Qty></Part>\n\r"
+
+    xml_pt3 = ""
+
+    try:
+        xml_pt3 = f"<SpecialInstructions>{parsed_order['SpecialInstructions']}</SpecialInstructions>"
+    except:
+        pass
+
+    xml_pt4 = "</Order>"
+    return f"{xml_pt1}{xml_pt2}{xml_pt3}{xml_pt4}"
+
+
+def make_order(num_parts, name='Jane Doe'):
+    order = order_model.Order(
+        'BENCH-1', '2024-01-02T15:04:05.000Z',
+        order_model.Address(name, '1 Main St', None, 'Springfield', 'IL', '62701', 'US', None),
+        (), ('Dropship Ready', 'Signature Required'), (), None)
+    parts = [order_model.Line(f"TAW-{i:06d}", i % 5 + 1) for i in range(num_parts)]
+    return order, parts, 'Signature Required'
+
+
+def parsed_order(order, parts, special_instructions):
+    # The dict the previous taw.submit_dropships built, for concat_order_xml
+    return {
+        'PONumber': order.order_number,
+        'ReqDate': order.order_placed_date,
+        'ShipTo': {
+            'Name': order.shipping_address.name,
+            'Address1': order.shipping_address.street1,
+            'Address2': order.shipping_address.street2,
+            'City': order.shipping_address.city,
+            'State': order.shipping_address.state,
+            'Zip': order.shipping_address.zip,
+            'Country': order.shipping_address.country
+        },
+        'Parts': [{'PartNo': part.sku, 'Qty': part.quantity} for part in parts],
+        'SpecialInstructions': special_instructions
+    }
+
+
+def best_of(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--parts', type=int, nargs='+', default=[10, 100, 1000, 10000], help="parts per order")
+    args = parser.parse_args()
+
+    # The new serializer has to produce XML TAW can parse, even with characters that need escaping
+    tricky = make_order(3, name='Smith & Sons <Warehouse>')
+    ET.fromstring(taw_xml.serialize_order(*tricky).encode())
+    try:
+        ET.fromstring(concat_order_xml(parsed_order(*tricky)).encode())
+        print("concat: escaping OK")
+    except ET.ParseError as err:
+        print(f"concat: malformed XML for a name with '&' ({err})")
+
+    print(f"{'parts':>7} {'concat us':>12} {'serializer us':>14} {'speedup':>8}")
+    for num_parts in args.parts:
+        order = make_order(num_parts)
+        old_order = parsed_order(*order)
+        number = max(1, 20000 // num_parts)
+
+        concat = best_of(lambda: concat_order_xml(old_order), number)
+        serializer = best_of(lambda: taw_xml.serialize_order(*order), number)
+
+        print(f"{num_parts:>7} {concat * 1e6:>12.1f} {serializer * 1e6:>14.1f} {concat / serializer:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
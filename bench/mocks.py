@@ -0,0 +1,340 @@
+"""
+Local stand-ins for the Ordoro, TAW and Meyer endpoints this repo calls, for benchmarking without live APIs.
+
+All three are served from one threaded HTTP server (keep-alive enabled) under /ordoro, /ordoro-legacy, /taw
+and /meyer. Latency, error rate and kit depth are configurable per server.
+"""
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+import urllib.parse
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+supplier_taw_id = 44251
+supplier_meyer_id = 44359
+
+tags = {
+    '30093': 'Dropship Ready',
+    '30067': 'Dropship Request Failed',
+    '30068': 'Awaiting Tracking'
+}
+
+
+class Upstreams:
+    """Shared state behind the mock endpoints: orders, products, and a count of every call made."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, kit_depth=1, num_parts=50, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.kit_depth = kit_depth
+        self.num_parts = num_parts
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.orders = dict()
+        self.products = dict()
+        self.calls = dict()
+
+        self.__build_products()
+
+    def __build_products(self):
+        for i in range(self.num_parts):
+            sku = f"P{i}"
+            self.products[sku] = {
+                'sku': sku,
+                'is_kit_parent': False,
+                'updated': '2026-01-01T00:00:00Z',
+                'kit_components': [],
+                'suppliers': [
+                    {'id': supplier_taw_id, 'supplier_sku': f"TAW-{i}"},
+                    {'id': supplier_meyer_id, 'supplier_sku': f"MEY-{i}"}
+                ]
+            }
+
+        # Kits at depth d are made of two kits from depth d-1, depth 0 being plain parts
+        previous = [f"P{i}" for i in range(self.num_parts)]
+        for depth in range(1, self.kit_depth + 1):
+            current = []
+            for i in range(10):
+                sku = f"K{depth}-{i}"
+                self.products[sku] = {
+                    'sku': sku,
+                    'is_kit_parent': True,
+                    'updated': '2026-01-01T00:00:00Z',
+                    'kit_components': [
+                        {'sku': previous[(2 * i) % len(previous)], 'quantity': 2},
+                        {'sku': previous[(2 * i + 1) % len(previous)], 'quantity': 1}
+                    ],
+                    'suppliers': []
+                }
+                current.append(sku)
+            previous = current
+
+        self.kits = previous if self.kit_depth > 0 else []
+
+    def add_orders(self, count, prefix='BENCH', test=True, kit_share=0.33, lines_per_order=2):
+        # Half the orders go to TAW, half to Meyer. Test mode only processes order numbers containing 'test'.
+        suffix = '-test' if test else ''
+        with self.lock:
+            for i in range(count):
+                order_number = f"{prefix}-{i}{suffix}"
+                lines = []
+                for _ in range(lines_per_order):
+                    if self.kits and self.random.random() < kit_share:
+                        sku = self.random.choice(self.kits)
+                    else:
+                        sku = f"P{self.random.randrange(self.num_parts)}"
+                    lines.append({'sku': sku, 'quantity': self.random.randint(1, 3)})
+
+                self.orders[order_number] = {
+                    'order_number': order_number,
+                    'order_placed_date': '2024-01-02T15:04:05.000Z',
+                    'supplier_id': supplier_taw_id if i % 2 == 0 else supplier_meyer_id,
+                    'dropshipping_info': {'supplier': {'id': supplier_taw_id if i % 2 == 0 else supplier_meyer_id}},
+                    'shipping_address': {
+                        'name': 'Jane Doe',
+                        'street1': '1 Main St',
+                        'street2': 'Suite 2',
+                        'city': 'Springfield',
+                        'state': 'IL',
+                        'zip': '62701',
+                        'country': 'US',
+                        'phone': '555-555-5555'
+                    },
+                    'lines': lines,
+                    'tags': [{'id': 30093, 'text': 'Dropship Ready'}],
+                    'comments': [],
+                    'shipping_info': None
+                }
+
+    def count_call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    upstreams = None
+
+    routes = [
+        ('GET', r'/ordoro/order', 'list_orders'),
+        ('GET', r'/ordoro/order/([^/]+)', 'get_order'),
+        ('POST', r'/ordoro/order/([^/]+)/tag/(\d+)', 'add_tag'),
+        ('DELETE', r'/ordoro/order/([^/]+)/tag/(\d+)', 'remove_tag'),
+        ('POST', r'/ordoro/order/([^/]+)/comment', 'add_comment'),
+        ('POST', r'/ordoro/order/([^/]+)/shipping_info', 'shipping_info'),
+        ('GET', r'/ordoro-legacy/product/', 'list_products'),
+        ('GET', r'/ordoro-legacy/product/([^/]+)/', 'get_product'),
+        ('POST', r'/taw/SubmitOrder', 'taw_submit'),
+        ('POST', r'/taw/GetTrackingInfo', 'taw_tracking'),
+        ('POST', r'/meyer/CreateOrder', 'meyer_create'),
+        ('GET', r'/meyer/SalesTracking', 'meyer_tracking'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.__dispatch('GET')
+
+    def do_POST(self):
+        self.__dispatch('POST')
+
+    def do_DELETE(self):
+        self.__dispatch('DELETE')
+
+    def __dispatch(self, method):
+        url = urllib.parse.urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        self.query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                self.upstreams.count_call(name)
+
+                if self.upstreams.latency:
+                    time.sleep(self.upstreams.latency)
+
+                if self.upstreams.random.random() < self.upstreams.error_rate:
+                    self.__send(503, b'{"errorMessage": "Service Unavailable"}', headers={'Retry-After': '0'})
+                    return
+
+                getattr(self, name)(*match.groups())
+                return
+
+        self.__send(404, b'{}')
+
+    def __send(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __json(self, obj, status=200):
+        self.__send(status, json.dumps(obj).encode())
+
+    def __order(self, order_number):
+        return self.upstreams.orders.get(urllib.parse.unquote(order_number))
+
+    # Ordoro
+
+    def list_orders(self):
+        tag = self.query['tag'][0]
+        supplier = self.query.get('supplier', [None])[0]
+        offset = int(self.query.get('offset', ['0'])[0])
+        limit = int(self.query.get('limit', ['100'])[0])
+
+        with self.upstreams.lock:
+            matching = [
+                order for order in self.upstreams.orders.values()
+                if any(t['text'] == tag for t in order['tags'])
+                and (supplier is None or str(order['supplier_id']) == supplier)]
+            page = json.loads(json.dumps(matching[offset:offset + limit]))
+
+        self.__json({'count': len(matching), 'limit': limit, 'offset': offset, 'order': page})
+
+    def get_order(self, order_number):
+        with self.upstreams.lock:
+            order = self.__order(order_number)
+            if order is None:
+                return self.__json({'error': 'not found'}, 404)
+            order = json.loads(json.dumps(order))
+        self.__json(order)
+
+    def add_tag(self, order_number, tag_id):
+        with self.upstreams.lock:
+            order = self.__order(order_number)
+            if order is None:
+                return self.__json({'error': 'not found'}, 404)
+            if not any(t['text'] == tags[tag_id] for t in order['tags']):
+                order['tags'].append({'id': int(tag_id), 'text': tags[tag_id]})
+        self.__json({})
+
+    def remove_tag(self, order_number, tag_id):
+        with self.upstreams.lock:
+            order = self.__order(order_number)
+            if order is None:
+                return self.__json({'error': 'not found'}, 404)
+            order['tags'] = [t for t in order['tags'] if t['text'] != tags[tag_id]]
+        self.__json({})
+
+    def add_comment(self, order_number):
+        with self.upstreams.lock:
+            order = self.__order(order_number)
+            if order is None:
+                return self.__json({'error': 'not found'}, 404)
+            order['comments'].append({'text': json.loads(self.body)['comment']})
+        self.__json({})
+
+    def shipping_info(self, order_number):
+        with self.upstreams.lock:
+            order = self.__order(order_number)
+            if order is None:
+                return self.__json({'error': 'not found'}, 404)
+            order['shipping_info'] = json.loads(self.body)
+        self.__json({})
+
+    def list_products(self):
+        offset = int(self.query.get('offset', ['0'])[0])
+        limit = int(self.query.get('limit', ['100'])[0])
+
+        # Products never change here, so anything asked for with updated_after is already up to date
+        products = [] if self.query.get('updated_after') else list(self.upstreams.products.values())
+        self.__json({'count': len(products), 'limit': limit, 'offset': offset, 'product': products[offset:offset + limit]})
+
+    def get_product(self, sku):
+        product = self.upstreams.products.get(urllib.parse.unquote(sku))
+        if product is None:
+            return self.__json({'error': 'not found'}, 404)
+        self.__json(product)
+
+    # TAW
+
+    def taw_submit(self):
+        form = urllib.parse.parse_qs(self.body.decode(), keep_blank_values=True)
+        try:
+            order = ET.fromstring(form['OrderInfo'][0].strip())
+            po_number = order.find('PONumber').text
+        except (KeyError, ET.ParseError, AttributeError):
+            return self.__send(200, b"<Response><Status>FAIL</Status></Response>", 'text/xml')
+
+        self.__send(200, f"<Response><Status>PASS</Status><Order Id='T{po_number}'/></Response>".encode(), 'text/xml')
+
+    def taw_tracking(self):
+        form = urllib.parse.parse_qs(self.body.decode(), keep_blank_values=True)
+        po_number = form['PONumber'][0]
+
+        records = ''.join(
+            f"<Record><InvoiceNumber>INV{i}-{po_number}</InvoiceNumber><TrackNum>1Z{i}{po_number}</TrackNum>"
+            f"<OrderDate>01/02/2024</OrderDate><Type>UPS</Type></Record>"
+            for i in range(2))
+        self.__send(200, f"<Response>{records}</Response>".encode(), 'text/xml')
+
+    # Meyer
+
+    def meyer_create(self):
+        order = json.loads(self.body)
+        self.__json({'Orders': [{'OrderNumber': f"M{order['CustPO']}"}]})
+
+    def meyer_tracking(self):
+        order_number = self.query['OrderNumber'][0]
+        self.__json([{'TrackingNumber': f"1ZM{order_number}"}])
+
+
+def start(upstreams):
+    handler = type('BoundHandler', (Handler,), {'upstreams': upstreams})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_config(base_url, **overrides):
+    # Builds the 'config' module from config.py.SAMPLE, pointed at the mocks, so the real modules import as usual
+    source = (repo_dir / 'config.py.SAMPLE').read_text()
+    source = re.sub(r"#[A-Z][^#\n]*#", 'None', source)
+
+    config = types.ModuleType('config')
+    exec(compile(source, 'config.py.SAMPLE', 'exec'), config.__dict__)
+
+    config.test = True
+    config.taw_url = f"{base_url}/taw"
+    config.ord_url = f"{base_url}/ordoro"
+    config.ord_legacy_url = f"{base_url}/ordoro-legacy"
+    config.meyer_test_url = f"{base_url}/meyer"
+    config.meyer_live_url = f"{base_url}/meyer"
+    # Orders here are made up, so they stay out of the audit log
+    config.audit_log = None
+
+    for key, value in overrides.items():
+        setattr(config, key, value)
+
+    config.setup_env()
+    sys.modules['config'] = config
+
+    if str(repo_dir) not in sys.path:
+        sys.path.insert(0, str(repo_dir))
+
+    return config
@@ -0,0 +1,89 @@
+import collections
+import json
+import sqlite3
+import threading
+import time
+
+
+class ProductCache:
+    """TTL + LRU cache for Ordoro products, with an optional SQLite tier that persists between runs."""
+
+    def __init__(self, ttl, max_size, db_path=None):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.__items = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__db = None
+
+        if db_path:
+            self.__db = sqlite3.connect(db_path, check_same_thread=False)
+            self.__db.execute("CREATE TABLE IF NOT EXISTS product (key TEXT PRIMARY KEY, fetched REAL, data TEXT)")
+            # Anything past its TTL would never be served again, so don't let it pile up on disk
+            self.__db.execute("DELETE FROM product WHERE fetched < ?", (time.time() - ttl,))
+            self.__db.commit()
+
+    def get(self, key):
+        now = time.time()
+
+        with self.__lock:
+            entry = self.__items.get(key)
+            if entry is not None:
+                fetched, value = entry
+                if now - fetched < self.ttl:
+                    self.__items.move_to_end(key)
+                    self.hits = self.hits + 1
+                    return value
+                del self.__items[key]
+
+            if self.__db is not None:
+                row = self.__db.execute(
+                    "SELECT fetched, data FROM product WHERE key = ? AND fetched >= ?",
+                    (key, now - self.ttl)).fetchone()
+                if row is not None:
+                    value = json.loads(row[1])
+                    self.__remember(key, row[0], value)
+                    self.disk_hits = self.disk_hits + 1
+                    return value
+
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+
+        with self.__lock:
+            self.__remember(key, now, value)
+
+            if self.__db is not None:
+                self.__db.execute(
+                    "INSERT OR REPLACE INTO product (key, fetched, data) VALUES (?, ?, ?)",
+                    (key, now, json.dumps(value)))
+                self.__db.commit()
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+
+            if self.__db is not None:
+                self.__db.execute("DELETE FROM product")
+                self.__db.commit()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'size': len(self.__items)
+        }
+
+    def __remember(self, key, fetched, value):
+        self.__items[key] = (fetched, value)
+        self.__items.move_to_end(key)
+
+        while len(self.__items) > self.max_size:
+            self.__items.popitem(last=False)
@@ -0,0 +1,216 @@
+import email.utils
+import random
+import threading
+import time
+import requests
+import requests.adapters
+import urllib3.exceptions
+import config
+import metrics
+import traffic
+
+__sessions = {}
+__sessions_lock = threading.Lock()
+__traffic = None
+
+# Responses worth retrying if the call is safe to repeat
+retry_statuses = (429, 500, 502, 503, 504)
+
+idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+# Responses that mean the upstream turned the request away without acting on it: rate limited, or a 503 from the
+# service itself saying when to come back. A bare 503 or a 502 may come from a proxy after the request got through.
+def was_rejected(r):
+    return r.status_code == 429 or (r.status_code == 503 and 'Retry-After' in r.headers)
+
+
+# Connection errors where the request never left: the connection couldn't be made (refused, DNS, connect timeout).
+# Anything else (aborted, reset, closed without a response) may have come after the upstream read the request.
+def never_connected(err):
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+
+    reason = err.args[0] if err.args else None
+    return isinstance(getattr(reason, 'reason', reason), urllib3.exceptions.NewConnectionError)
+
+
+class RateLimiter:
+    """
+    Token bucket for one upstream. Halves its rate when the upstream pushes back (429/5xx, honouring
+    Retry-After) and creeps back up to the configured rate as calls succeed.
+    """
+
+    def __init__(self, rate):
+        self.max_rate = rate
+        self.min_rate = rate / 20
+        self.rate = rate
+
+        self.__tokens = max(rate, 1)
+        self.__updated = time.monotonic()
+        self.__paused_until = 0
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(max(self.rate, 1), self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+
+                if now >= self.__paused_until and self.__tokens >= 1:
+                    self.__tokens = self.__tokens - 1
+                    return
+
+                wait = max(self.__paused_until - now, (1 - self.__tokens) / self.rate)
+
+            time.sleep(wait)
+
+    def throttled(self, retry_after=None):
+        with self.__lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+            if retry_after:
+                self.__paused_until = max(self.__paused_until, time.monotonic() + retry_after)
+
+    def succeeded(self):
+        with self.__lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class Session(requests.Session):
+    """
+    requests.Session that applies a default timeout and rate limit to every call, and retries with jittered
+    exponential backoff. Calls are only retried after a connection error or 5xx if they're safe to repeat
+    (idempotent methods, or idempotent=True); a 429 means nothing happened upstream, so any call is retried.
+    Every attempt is timed into metrics under 'endpoint' (the URL path if not given).
+    """
+
+    def __init__(self, upstream, timeout, limiter, max_retries, backoff):
+        super().__init__()
+        self.upstream = upstream
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def request(self, method, url, idempotent=None, endpoint=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        if endpoint is None:
+            endpoint = f"{method.upper()} {requests.utils.urlparse(url).path}"
+
+        if idempotent is None:
+            idempotent = method.upper() in idempotent_methods
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+
+            started = time.perf_counter()
+            try:
+                r = super().request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.record_call(self.upstream, endpoint, time.perf_counter() - started, error=True)
+                self.limiter.throttled()
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+            else:
+                metrics.record_call(self.upstream, endpoint, time.perf_counter() - started, error=r.status_code >= 400)
+
+                if r.status_code not in retry_statuses:
+                    self.limiter.succeeded()
+                    return r
+
+                retry_after = self.__retry_after(r)
+                self.limiter.throttled(retry_after)
+
+                if attempt >= self.max_retries or not (idempotent or r.status_code == 429):
+                    return r
+
+                if retry_after:
+                    attempt = attempt + 1
+                    continue
+
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt = attempt + 1
+
+    def send(self, request, **kwargs):
+        # Where record/replay (http_traffic) sits, under the retries and rate limiting
+        if config.http_traffic == 'replay':
+            r = get_traffic().replay(self.upstream, request, config.http_replay_speed)
+            if r is None:
+                # As if the upstream couldn't be reached, nothing was sent
+                raise requests.exceptions.ConnectTimeout(f"Nothing recorded for {request.method} {request.url}")
+            return r
+
+        r = super().send(request, **kwargs)
+
+        if config.http_traffic == 'record':
+            get_traffic().record(self.upstream, request, r)
+
+        return r
+
+    @staticmethod
+    def __retry_after(r):
+        # Retry-After is either a number of seconds or an HTTP date
+        value = r.headers.get('Retry-After')
+        if not value:
+            return None
+
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+
+def __new_session(upstream):
+    # The limits are for all shards together, each shard gets its share
+    rate = config.http_rate_limits[upstream] / max(config.shard_count, 1)
+
+    # A replay sped up (or with no waiting at all) shouldn't be held back to the real services' limits
+    if config.http_traffic == 'replay':
+        rate = rate * config.http_replay_speed if config.http_replay_speed else 1e9
+
+    session = Session(
+        upstream,
+        (config.http_connect_timeout, config.http_read_timeout),
+        RateLimiter(rate),
+        config.http_max_retries,
+        config.http_backoff)
+
+    # Block rather than open throwaway connections when every pooled connection is busy
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=config.http_pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_traffic():
+    global __traffic
+
+    with __sessions_lock:
+        if __traffic is None:
+            __traffic = traffic.TrafficStore(config.http_traffic_db)
+        return __traffic
+
+
+def get_session(upstream):
+    # One pooled, keep-alive, rate limited session per upstream ('ordoro', 'taw', 'meyer')
+    with __sessions_lock:
+        if upstream not in __sessions:
+            __sessions[upstream] = __new_session(upstream)
+        return __sessions[upstream]
+
+
+def close_sessions():
+    with __sessions_lock:
+        for session in __sessions.values():
+            session.close()
+        __sessions.clear()
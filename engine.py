@@ -0,0 +1,18 @@
+import concurrent.futures
+import logging
+import config
+import metrics
+
+logger = logging.getLogger('process-dropships')
+
+
+def run(*phases):
+    # Runs every phase (e.g. functools.partial(pipeline.submit_dropships, adapter)) at the same time, each on a
+    # thread of one shared executor. A phase still works through its orders with its supplier's own concurrency.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(len(phases), config.engine_threads), 1)) as executor:
+        futures = [executor.submit(metrics.carry_phase(phase)) for phase in phases]
+
+    # A phase failing outright (e.g. Ordoro being down) shouldn't stop the others
+    for future in futures:
+        if future.exception() is not None:
+            logger.error("Error! A phase stopped early.", exc_info=future.exception())
@@ -8,3 +8,32 @@ class SupplierSKUNotFound(Error):
 
     def msg(self):
         return f"Supplier SKU not found for product {self.sku}"
+
+
+class KitCycleFound(Error):
+    def __init__(self, sku):
+        self.sku = sku
+
+    def msg(self):
+        return f"Kit {self.sku} contains itself"
+
+
+class SupplierRejected(Error):
+    def __init__(self, supplier, reason):
+        self.supplier = supplier
+        self.reason = reason
+
+    def msg(self):
+        return f"{self.supplier} didn't accept the order: {self.reason}"
+
+
+class OrderPageFailed(Error):
+    def __init__(self, tag, offset, status_code):
+        self.tag = tag
+        self.offset = offset
+        self.status_code = status_code
+        # Listing errors end a phase, so they're logged with a traceback rather than through msg()
+        super().__init__(self.msg())
+
+    def msg(self):
+        return f"Ordoro answered {self.status_code} for the '{self.tag}' orders at offset {self.offset}"
@@ -0,0 +1,207 @@
+import contextvars
+import json
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+current_phase = contextvars.ContextVar('current_phase', default='none')
+
+__lock = threading.Lock()
+__calls = dict()
+__orders = dict()
+__started = time.time()
+
+# The phase each thread is working in, for the profiler (see profiling.py), which can't read another thread's context
+__thread_phases = dict()
+
+
+class Timing:
+    """Call count, error count and latency histogram for one endpoint or phase."""
+
+    __slots__ = ('count', 'errors', 'total', 'max', 'bucket_counts')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def add(self, seconds, error):
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        self.max = max(self.max, seconds)
+
+        if error:
+            self.errors = self.errors + 1
+
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] = self.bucket_counts[i] + 1
+                return
+        self.bucket_counts[-1] = self.bucket_counts[-1] + 1
+
+    def merge(self, timing):
+        # timing is another Timing's as_dict(), e.g. from the metrics file of a shard run in its own process
+        self.count = self.count + timing['count']
+        self.errors = self.errors + timing['errors']
+        self.total = self.total + timing['total']
+        self.max = max(self.max, timing['max'])
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, timing['buckets'])]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else 0,
+            'max': round(self.max, 6),
+            'buckets': list(self.bucket_counts)
+        }
+
+
+def set_phase(phase):
+    __thread_phases[threading.get_ident()] = phase
+    return current_phase.set(phase)
+
+
+def reset_phase(token):
+    current_phase.reset(token)
+    __thread_phases[threading.get_ident()] = current_phase.get()
+
+
+def thread_phase(thread_id):
+    return __thread_phases.get(thread_id, 'none')
+
+
+def carry_phase(fn):
+    # Wraps fn so it's attributed to the caller's phase when it runs on another thread
+    phase = current_phase.get()
+
+    def run(*args, **kwargs):
+        token = set_phase(phase)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            reset_phase(token)
+
+    return run
+
+
+def record_call(upstream, endpoint, seconds, error=False):
+    key = (upstream, endpoint, current_phase.get())
+    with __lock:
+        if key not in __calls:
+            __calls[key] = Timing()
+        __calls[key].add(seconds, error)
+
+
+def record_order(seconds, error=False):
+    phase = current_phase.get()
+    with __lock:
+        if phase not in __orders:
+            __orders[phase] = Timing()
+        __orders[phase].add(seconds, error)
+
+
+def reset():
+    global __started
+
+    with __lock:
+        __calls.clear()
+        __orders.clear()
+        __started = time.time()
+
+
+def __summarize(started, duration, calls, orders):
+    return {
+        'started': started,
+        'duration': round(duration, 6),
+        'buckets': list(buckets),
+        'calls': [
+            dict(upstream=upstream, endpoint=endpoint, phase=phase, **timing.as_dict())
+            for (upstream, endpoint, phase), timing in sorted(calls.items())],
+        'orders': [dict(phase=phase, **timing.as_dict()) for phase, timing in sorted(orders.items())]
+    }
+
+
+def summary():
+    with __lock:
+        return __summarize(__started, time.time() - __started, __calls, __orders)
+
+
+def merge(run_summaries):
+    # Combines summaries from runs over separate shards into one, as if it had been a single run
+    calls = dict()
+    orders = dict()
+
+    for run_summary in run_summaries:
+        for call in run_summary['calls']:
+            key = (call['upstream'], call['endpoint'], call['phase'])
+            if key not in calls:
+                calls[key] = Timing()
+            calls[key].merge(call)
+
+        for order in run_summary['orders']:
+            if order['phase'] not in orders:
+                orders[order['phase']] = Timing()
+            orders[order['phase']].merge(order)
+
+    started = min((run_summary['started'] for run_summary in run_summaries), default=time.time())
+    ended = max((run_summary['started'] + run_summary['duration'] for run_summary in run_summaries), default=started)
+
+    return __summarize(started, ended - started, calls, orders)
+
+
+def __prometheus_histogram(lines, name, labels, timing):
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ['+Inf'], timing['buckets']):
+        cumulative = cumulative + count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {timing["total"]}')
+    lines.append(f'{name}_count{{{labels}}} {timing["count"]}')
+
+
+def prometheus(run_summary=None):
+    # Prometheus text exposition format, for the node_exporter textfile collector or a pushgateway
+    run_summary = run_summary or summary()
+    lines = [
+        '# HELP dropships_upstream_call_seconds Latency of calls to Ordoro, TAW and Meyer.',
+        '# TYPE dropships_upstream_call_seconds histogram'
+    ]
+    for call in run_summary['calls']:
+        labels = f'upstream="{call["upstream"]}",endpoint="{call["endpoint"]}",phase="{call["phase"]}"'
+        __prometheus_histogram(lines, 'dropships_upstream_call_seconds', labels, call)
+
+    lines.append('# HELP dropships_upstream_call_errors_total Calls that failed or returned an error status.')
+    lines.append('# TYPE dropships_upstream_call_errors_total counter')
+    for call in run_summary['calls']:
+        labels = f'upstream="{call["upstream"]}",endpoint="{call["endpoint"]}",phase="{call["phase"]}"'
+        lines.append(f'dropships_upstream_call_errors_total{{{labels}}} {call["errors"]}')
+
+    lines.append('# HELP dropships_order_seconds Time to process one order, end to end.')
+    lines.append('# TYPE dropships_order_seconds histogram')
+    for order in run_summary['orders']:
+        __prometheus_histogram(lines, 'dropships_order_seconds', f'phase="{order["phase"]}"', order)
+
+    lines.append('# HELP dropships_run_seconds Duration of the run.')
+    lines.append('# TYPE dropships_run_seconds gauge')
+    lines.append(f'dropships_run_seconds {run_summary["duration"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def write(json_path=None, prometheus_path=None, run_summary=None):
+    run_summary = run_summary or summary()
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(run_summary, f, indent=2)
+
+    if prometheus_path:
+        with open(prometheus_path, 'w') as f:
+            f.write(prometheus(run_summary))
+
+    return run_summary
@@ -1,8 +1,8 @@
-import requests
 import json
 import config
-import ordoro
+import clients
 import errors
+import suppliers
 import logging
 
 logger = logging.getLogger('process-dropships')
@@ -19,192 +19,95 @@ def __get_headers():
     }
 
 
-def __post_create_order(order_data):
-    return requests.post(
+def post_create_order(order_data):
+    return clients.get_session('meyer').post(
         f"{__get_url()}/CreateOrder",
         data=json.dumps(order_data),
-        headers=__get_headers()
-    ).json()
+        headers=__get_headers(),
+        endpoint='CreateOrder'
+    )
 
 
-def __get_sales_tracking(order_id):
-    return requests.get(
+def get_sales_tracking(order_id):
+    return clients.get_session('meyer').get(
         f"{__get_url()}/SalesTracking",
         params={'OrderNumber': order_id},
-        headers=__get_headers()
+        headers=__get_headers(),
+        endpoint='SalesTracking'
     ).json()
 
 
-def submit_dropships():
-    # Get all Dropship Ready orders associated with Meyer
-    logger.info("Requesting all Meyer orders with 'Dropship Ready' from Ordoro...")
-    robj = ordoro.get_dropship_ready_orders(ordoro.supplier_meyer_id)
+class Meyer(suppliers.Adapter):
+    name = 'meyer'
+    label = 'Meyer'
+    # Meyer order numbers are added as comments when the order is submitted, that's how tracking finds them
+    order_id_comment = "[SR-MID]: {}"
+    shipping_cost = 13
 
-    if robj['count'] < 1:
-        logger.info("No orders returned. Nothing to do.")
-        return
+    def build_order(self, order, product_list):
+        shipinf = order.shipping_address
 
-    orders = robj['order']
+        # Create dictionary for order information
+        return {
+            'ShipMethod': 'UPS GRND RES',
+            'ShipToName': shipinf.name,
+            'ShipToAddress1': shipinf.street1,
+            'ShipToAddress2': shipinf.street2,
+            'ShipToCity': shipinf.city,
+            'ShipToState': shipinf.state,
+            'ShipToZipcode': shipinf.zip,
+            'ShipToPhone': shipinf.phone,
+            'CustPO': order.order_number,
+            'Items': [{'ItemNumber': line.sku, 'Quantity': line.quantity} for line in product_list],
+            # Meyer requires 3-char country code
+            'ShipToCountry': 'USA' if shipinf.country == 'US' else shipinf.country
+        }
 
-    logger.info(f"Found {robj['count']} to process.")
+    def submit(self, payload):
+        return post_create_order(payload)
 
-    # Loop through orders
-    for order in orders:
-        # Determine if order should be skipped based on what mode we're in
-        if config.should_skip(order['order_number']):
-            logger.info(f"Skipping order {order['order_number']}.")
-            continue
+    def parse_response(self, r):
+        rob = r.json()
 
-        logger.info(f"Processing order {order['order_number']}...")
+        if 'Orders' not in rob:
+            raise errors.SupplierRejected(self.label, f"{rob.get('errorCode')} {rob.get('errorMessage')}")
 
-        shipinf = order['shipping_address']
+        return [str(mey_order['OrderNumber']) for mey_order in rob['Orders']]
 
-        # Create dictionary for order information
-        order_info = {
-            'ShipMethod': 'UPS GRND RES',
-            'ShipToName': shipinf['name'],
-            'ShipToAddress1': shipinf['street1'],
-            'ShipToAddress2': shipinf['street2'],
-            'ShipToCity': shipinf['city'],
-            'ShipToState': shipinf['state'],
-            'ShipToZipcode': shipinf['zip'],
-            'ShipToPhone': shipinf['phone'],
-            'CustPO': order['order_number'],
-            'Items': []
-        }
+    def supplier_order_ids(self, order):
+        return [comment.split(':')[1].strip() for comment in order.comments if '[SR-MID]' in comment]
 
-        # Meyer requires 3-char country code
-        if shipinf['country'] == 'US':
-            order_info['ShipToCountry'] = 'USA'
-        else:
-            order_info['ShipToCountry'] = shipinf['country']
+    def fetch_tracking(self, order, supplier_order_ids):
+        return self.fetch_tracking_batch([order], {order.order_number: supplier_order_ids})[order.order_number]
 
-        try:
-            product_list = ordoro.get_product_list(order['lines'], ordoro.supplier_meyer_id)
-            for product in product_list:
-                order_info['Items'].append({'ItemNumber': product['sku'], 'Quantity': product['qty']})
-        except errors.SupplierSKUNotFound as e:
-            logger.error(f"Error: {e.msg()}")
-            logger.error("Unable to parse product list. Skipping order.")
-            continue
-
-        # Send to Meyer
-        logger.info(f"Sending order {order['order_number']} to Meyer...")
-        logger.debug(f"{order_info}")
-
-        rob = __post_create_order(order_info)
-        logger.info(f"Parsing response from Meyer...")
+    def fetch_tracking_batch(self, orders, supplier_order_ids):
+        # Meyer looks up one of its orders per call, so every Meyer order in the batch is fetched side by side,
+        # then the results are put back together by Ordoro order
+        order_numbers = {
+            mey_order_id: order_number for order_number, ids in supplier_order_ids.items() for mey_order_id in ids}
+        fetched = suppliers.fetch_each(get_tracking_for, list(order_numbers))
 
-        try:
-            mey_orders = rob['Orders']
-        except KeyError:
-            logger.error("Error! Unexpected response from Meyer.")
-            logger.error(f"Error code: {rob['errorCode']}")
-            logger.error(f"Error message: {rob['errorMessage']}")
-
-            logger.info("Removing 'Dropship Ready' tag...")
-            ordoro.delete_tag_drop_ready(order['order_number'])
-
-            logger.info("Adding 'Dropship Failed' tag...")
-            ordoro.post_tag_drop_fail(order['order_number'])
-
-            logger.info("Skipping order.")
-            continue
-
-        try:
-            for mey_order in mey_orders:
-                # Loop through responses and add order ids returned as comments
-                logger.info(f"Adding Meyer order number {mey_order['OrderNumber']} as comment...")
-                ordoro.post_comment(order['order_number'], f"[SR-MID]: {mey_order['OrderNumber']}")
-
-            logger.info("Removing 'Dropship Ready' tag...")
-            ordoro.delete_tag_drop_ready(order['order_number'])
-
-            logger.info("Adding 'Awaiting Tracking' tag...")
-            ordoro.post_tag_await_track(order['order_number'])
-        except Exception as err:
-            logger.info("Unable to parse response from Meyer. Error:")
-            logger.info(f"{err}")
-            logger.debug(f"{rob}")
-            logger.info("Skipping.\n\r")
-            continue
-
-        logger.info(f"Done submitting order {order['order_number']}.\n\r")
-
-    logger.info("Done submitting Meyer dropships.\n\r")
-
-
-def get_tracking():
-    # Get all Awaiting Tracking orders associate with Meyer
-    logger.info("Requesting all Meyer orders with 'Awaiting Tracking' from Ordoro...")
-    rob = ordoro.get_await_track_orders(ordoro.supplier_meyer_id)
-
-    if rob['count'] < 1:
-        logger.info("No orders returned. Nothing to do.")
-        return
-
-    orders = rob['order']
-
-    logger.info(f"Found {rob['count']} to process.")
-
-    # Loop through orders
-    for order in orders:
-        # Determine if order should be skipped based on what mode we're in
-        if config.should_skip(order['order_number']):
-            logger.info(f"Skipping order {order['order_number']}.\n\r")
-            continue
-
-        logger.info(f"Processing order {order['order_number']}...")
-
-        # Keep track of how many tracking numbers we get back, 1st is added as official shipping method
-        num_tracking = 1
-        for comment in order['comments']:
-            if '[SR-MID]' in comment['text']:
-                mey_order_id = comment['text'].split(':')[1].strip()
-
-                logger.info(f"Asking Meyer for tracking info on order {mey_order_id}...")
-                tracking_info = __get_sales_tracking(mey_order_id)
-
-                # If what we get back isn't a list, it means nothing was found
-                if not isinstance(tracking_info, list):
-                    logger.info(f"Could not retrieve tracking info: {tracking_info['errorMessage']}, skipping.\n\r")
-                    continue
-
-                logger.info(f"Tracking info retrieved, processing...")
-
-                for tracking in tracking_info:
-                    # If this is the first tracking number, we add it as the official shipping method
-                    if num_tracking == 1:
-                        shipping_data = dict()
-
-                        shipping_data['tracking_number'] = tracking['TrackingNumber']
-                        shipping_data['ship_date'] = order['order_placed_date']
-                        shipping_data['carrier_name'] = 'UPS'
-                        shipping_data['shipping_method'] = 'ground'
-                        shipping_data['cost'] = 13
+        results = {order.order_number: [] for order in orders}
+        for mey_order_id, tracking in zip(order_numbers, fetched):
+            if isinstance(tracking, Exception):
+                logger.error(f"Error! Unable to get tracking for Meyer order {mey_order_id}: {tracking}. Skipping.")
+                continue
+            results[order_numbers[mey_order_id]] = results[order_numbers[mey_order_id]] + tracking
 
-                        logger.info(f"Applying {shipping_data['tracking_number']} as official shipping method...")
-                        ordoro.post_shipping_info(order['order_number'], shipping_data)
+        return results
 
-                        logger.info("Removing 'Awaiting Tracking' tag...")
-                        ordoro.delete_tag_await_track(order['order_number'])
 
-                        num_tracking = num_tracking + 1
-                    else:
-                        # If this is not the first tracking number, add it as a comment
-                        tracking_number = tracking['TrackingNumber']
+def get_tracking_for(mey_order_id):
+    logger.info(f"Asking Meyer for tracking info on order {mey_order_id}...")
+    tracking_info = get_sales_tracking(mey_order_id)
 
-                        logger.info(f"Applying {tracking_number} in a comment...")
-                        ordoro.post_comment(
-                            order['order_number'],
-                            f"Additional tracking information: "
-                            f"Order ID: {mey_order_id} "
-                            f"Tracking Number: {tracking_number}"
-                        )
-                        num_tracking = num_tracking + 1
+    # If what we get back isn't a list, it means nothing was found
+    if not isinstance(tracking_info, list):
+        logger.info(f"Could not retrieve tracking info for {mey_order_id}: {tracking_info['errorMessage']}, skipping.")
+        return []
 
-                logger.info(f"Finished applying tracking for Meyer order {mey_order_id}.")
+    # Meyer only ships UPS ground, and doesn't say when (the pipeline falls back to the order date)
+    return [suppliers.Tracking(mey_order_id, tracking['TrackingNumber'], 'UPS', None) for tracking in tracking_info]
 
-        logger.info(f"Finished applying tracking for Ordoro order {order['order_number']}.\n\r")
 
-    logger.info("Finished getting tracking info from Meyer.\n\r")
\ No newline at end of file
+adapter = suppliers.register(Meyer())
@@ -0,0 +1,46 @@
+import collections
+import sys
+
+# What the pipeline keeps of an Ordoro order. Built once from the listing JSON (see ordoro.py) and handed to
+# every phase and supplier, the rest of the order (prices, customer, notes, shipping info, ...) is dropped.
+# Namedtuples have no per-instance __dict__, so a large backlog in flight costs a fraction of the raw JSON.
+Address = collections.namedtuple(
+    'Address', ['name', 'street1', 'street2', 'city', 'state', 'zip', 'country', 'phone'])
+
+# An order line, and also a line of the product list sent to a supplier (sku being the supplier's SKU)
+Line = collections.namedtuple('Line', ['sku', 'quantity'])
+
+# tags and comments are just their text, supplier_id is the supplier Ordoro has the order set to drop ship from
+Order = collections.namedtuple(
+    'Order', ['order_number', 'order_placed_date', 'shipping_address', 'lines', 'tags', 'comments', 'supplier_id'])
+
+
+def __intern(value):
+    # The same few values (tag names, states, countries) turn up on every order, so keep one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def address_from_json(address):
+    address = address or {}
+    return Address(
+        address.get('name'),
+        address.get('street1'),
+        address.get('street2'),
+        address.get('city'),
+        __intern(address.get('state')),
+        address.get('zip'),
+        __intern(address.get('country')),
+        address.get('phone'))
+
+
+def order_from_json(order):
+    supplier = (order.get('dropshipping_info') or {}).get('supplier') or {}
+
+    return Order(
+        order['order_number'],
+        order['order_placed_date'],
+        address_from_json(order.get('shipping_address')),
+        tuple(Line(__intern(line['sku']), line['quantity']) for line in order.get('lines') or ()),
+        tuple(__intern(tag['text']) for tag in order.get('tags') or ()),
+        tuple(comment['text'] for comment in order.get('comments') or ()),
+        supplier.get('id'))
@@ -1,11 +1,16 @@
-import requests
+import concurrent.futures
+import threading
 import json
+import logging
 import config
+import cache
+import product_index
+import order_model
+import clients
+import metrics
+import shards
 import errors
 
-url = config.ord_url
-legacy_url = config.ord_legacy_url
-
 tag_drop_ready = {
     'id': '30093',
     'name': 'Dropship Ready'
@@ -21,8 +26,39 @@ tag_await_track = {
     'name': 'Awaiting Tracking'
 }
 
-supplier_taw_id = 44251
-supplier_meyer_id = 44359
+logger = logging.getLogger('process-dropships')
+
+order_page_limit = 100
+product_page_limit = 100
+
+__product_cache = None
+__product_cache_lock = threading.Lock()
+
+__product_indexes = dict()
+__product_indexes_lock = threading.Lock()
+
+
+def __session():
+    return clients.get_session('ordoro')
+
+
+def __get_url():
+    return config.ord_url
+
+
+def __get_legacy_url():
+    return config.ord_legacy_url
+
+
+def get_product_cache():
+    # Opened on first use rather than at import, so starting up doesn't touch the cache file
+    global __product_cache
+
+    with __product_cache_lock:
+        if __product_cache is None:
+            __product_cache = cache.ProductCache(
+                config.product_cache_ttl, config.product_cache_size, config.product_cache_db)
+        return __product_cache
 
 
 def __get_headers():
@@ -32,14 +68,57 @@ def __get_headers():
     }
 
 
-def __get_orders(tag, supplier=None):
+def __get_order_page(tag, supplier, offset):
     params = {
         'tag': tag['name'],
-        'limit': 100
+        'limit': order_page_limit,
+        'offset': offset
     }
     if supplier:
         params['supplier'] = supplier
-    return requests.get(f"{url}/order", params=params, headers=__get_headers()).json()
+    r = __session().get(f"{__get_url()}/order", params=params, headers=__get_headers(), endpoint='GET /order')
+    if not r.ok:
+        raise errors.OrderPageFailed(tag['name'], offset, r.status_code)
+    return r.json()
+
+
+def __get_order_pages(tag, supplier=None):
+    # Orders drop out of the tag as they get processed, which shifts every later offset down.
+    # Walking the pages from the last offset back to the first means the only orders that
+    # drop out are ones behind us, so nothing gets skipped.
+    first_page = __get_order_page(tag, supplier, 0)
+    last_offset = (first_page['count'] - 1) // order_page_limit * order_page_limit
+    offsets = list(range(last_offset, 0, -order_page_limit))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(metrics.carry_phase(__get_order_page), tag, supplier, offsets[0]) if offsets else None
+
+        for i in range(len(offsets)):
+            page = next_page.result()
+
+            # Prefetch the next page while the caller works through this one
+            if i + 1 < len(offsets):
+                next_page = executor.submit(metrics.carry_phase(__get_order_page), tag, supplier, offsets[i + 1])
+
+            yield page
+
+    yield first_page
+
+
+def __get_orders(tag, supplier=None):
+    # Orders added while we're paging can push an order we've already seen onto the next page
+    seen = set()
+    for page in __get_order_pages(tag, supplier):
+        for order in page['order']:
+            if order['order_number'] in seen or not shards.mine(order['order_number']):
+                continue
+            seen.add(order['order_number'])
+            yield order_model.order_from_json(order)
+
+
+def get_order(order_number):
+    r = __session().get(f"{__get_url()}/order/{order_number}", headers=__get_headers(), endpoint='GET /order/{id}')
+    return order_model.order_from_json(r.json()) if r.ok else None
 
 
 def get_dropship_ready_orders(supplier=None):
@@ -50,12 +129,68 @@ def get_await_track_orders(supplier=None):
     return __get_orders(tag_await_track, supplier)
 
 
+def __mode():
+    return 'test' if config.test else 'live'
+
+
 def get_product(sku):
-    return requests.get(f"{legacy_url}/product/{sku}/", headers=__get_headers()).json()
+    # Test and live accounts have separate catalogs, so don't let one answer for the other
+    key = f"{__mode()}:{sku}"
+
+    product_cache = get_product_cache()
+    product = product_cache.get(key)
+    if product is None:
+        r = __session().get(
+            f"{__get_legacy_url()}/product/{sku}/", headers=__get_headers(), endpoint='GET /product/{sku}/')
+        product = r.json()
+
+        if r.ok:
+            product_cache.put(key, product)
+
+    return product
+
+
+def get_products(updated_after=None):
+    # The listing doesn't shift under us like the tagged order lists do, so plain forward paging is fine
+    offset = 0
+    while True:
+        params = {'limit': product_page_limit, 'offset': offset}
+        if updated_after:
+            params['updated_after'] = updated_after
+        page = __session().get(
+            f"{__get_legacy_url()}/product/", params=params, headers=__get_headers(), endpoint='GET /product/').json()
+
+        yield from page['product']
+
+        offset = offset + product_page_limit
+        if offset >= page['count']:
+            return
+
+
+def get_product_index():
+    # Built on first use in each mode, then topped up with changed products every product_index_refresh seconds
+    mode = __mode()
+
+    with __product_indexes_lock:
+        index = __product_indexes.get(mode)
+        if index is None:
+            index = product_index.ProductIndex(mode, config.state_db)
+            __product_indexes[mode] = index
+
+        if index.stale(config.product_index_refresh):
+            full = index.refreshed_through is None
+            logger.info(f"{'Loading' if full else 'Refreshing'} the {mode} product index from Ordoro...")
+            changed = index.refresh(get_products)
+            logger.info(f"{changed} products {'loaded' if full else 'changed'}, {len(index)} in the index.")
+
+    return index
 
 
 def __post_tag(order_id, tag):
-    return requests.post(f"{url}/order/{order_id}/tag/{tag['id']}", headers=__get_headers())
+    # Adding a tag that's already there changes nothing, so it's safe to retry
+    return __session().post(
+        f"{__get_url()}/order/{order_id}/tag/{tag['id']}", headers=__get_headers(), idempotent=True,
+        endpoint='POST /order/tag')
 
 
 def post_tag_drop_fail(order_id):
@@ -67,7 +202,8 @@ def post_tag_await_track(order_id):
 
 
 def __delete_tag(order_id, tag):
-    return requests.delete(f"{url}/order/{order_id}/tag/{tag['id']}", headers=__get_headers())
+    return __session().delete(
+        f"{__get_url()}/order/{order_id}/tag/{tag['id']}", headers=__get_headers(), endpoint='DELETE /order/tag')
 
 
 def delete_tag_drop_ready(order_id):
@@ -80,12 +216,138 @@ def delete_tag_await_track(order_id):
 
 def post_comment(order_id, comment):
     data = json.dumps({'comment': comment})
-    return requests.post(f"{url}/order/{order_id}/comment", headers=__get_headers(), data=data)
+    return __session().post(
+        f"{__get_url()}/order/{order_id}/comment", headers=__get_headers(), data=data, endpoint='POST /order/comment')
+
+
+class MutationBuffer:
+    """
+    Collects tag and comment changes made while processing orders and sends them to Ordoro in batches.
+    Changes for an order are applied in the order they were made, orders are flushed side by side. An order is
+    only sent once done() says it has all its changes, so they always go out in one batch, and once a change
+    fails every later one for the order is dropped, in this batch or any after it.
+    With batch=False every change goes straight to Ordoro as it is made, with the same dropping after a failure.
+    """
+
+    def __init__(self, batch=True, flush_size=50, concurrency=8):
+        self.batch = batch
+        self.flush_size = flush_size
+        self.concurrency = concurrency
+
+        self.__pending = dict()
+        self.__done = set()
+        self.__failed = set()
+        self.__lock = threading.Lock()
+
+    def post_tag_drop_fail(self, order_id):
+        self.__add(order_id, post_tag_drop_fail)
+
+    def post_tag_await_track(self, order_id):
+        self.__add(order_id, post_tag_await_track)
+
+    def delete_tag_drop_ready(self, order_id):
+        self.__add(order_id, delete_tag_drop_ready)
+
+    def delete_tag_await_track(self, order_id):
+        self.__add(order_id, delete_tag_await_track)
+
+    def post_comment(self, order_id, comment):
+        self.__add(order_id, post_comment, comment)
+
+    def after(self, order_id, fn, *args):
+        # Calls fn(order_id, *args) once every change made to the order so far has gone through. Not at all if one failed.
+        self.__add(order_id, fn, *args)
+
+    def done(self, order_id):
+        # No more changes are coming for the order, it can go out with the next batch
+        if not self.batch:
+            return
+
+        with self.__lock:
+            if order_id not in self.__pending:
+                return
+            self.__done.add(order_id)
+            if len(self.__done) < self.flush_size:
+                return
+
+            pending = {done_id: self.__pending.pop(done_id) for done_id in self.__done}
+            self.__done = set()
+
+        self.__send(pending)
+
+    def flush(self):
+        # Sends everything collected so far, done or not (for when nothing else is being processed).
+        # Returns {order_id: True/False} for whether all its changes went through.
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = dict()
+            self.__done = set()
+
+        return self.__send(pending)
+
+    def __send(self, pending):
+        if not pending:
+            return {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = dict(zip(pending, executor.map(metrics.carry_phase(self.__apply), pending.items())))
+
+        failed = [order_id for order_id, ok in results.items() if not ok]
+        with self.__lock:
+            self.__failed.update(failed)
+
+        logger.info(f"Sent Ordoro changes for {len(results)} orders, {len(failed)} failed.")
+        for order_id in failed:
+            logger.error(f"Error! Not all Ordoro changes were applied to order {order_id}. Check its tags.")
+
+        return results
+
+    def __add(self, order_id, fn, *args):
+        if not self.batch:
+            # Once a change fails, later ones for the order are dropped, same as in a batch
+            if order_id not in self.__failed and not self.__apply((order_id, [(fn, args)])):
+                self.__failed.add(order_id)
+            return
+
+        with self.__lock:
+            # A change failed in an earlier batch, so this one mustn't go through either
+            if order_id in self.__failed:
+                return
+
+            changes = self.__pending.setdefault(order_id, [])
+            # Nothing gained by sending the same change twice
+            if (fn, args) not in changes:
+                changes.append((fn, args))
+
+    @staticmethod
+    def __apply(item):
+        order_id, changes = item
+
+        for fn, args in changes:
+            try:
+                r = fn(order_id, *args)
+            except Exception as err:
+                logger.error(f"Error! Unable to update order {order_id} in Ordoro: {err}")
+                return False
+
+            # Callbacks given to after() don't return a response
+            if r is not None and not r.ok:
+                logger.error(f"Error! Ordoro rejected {fn.__name__} for order {order_id}: {r.status_code}")
+                return False
+
+        return True
+
+
+def mutations():
+    return MutationBuffer(config.ord_batch_writes, config.ord_flush_size, config.ord_flush_concurrency)
 
 
 def post_shipping_info(order_id, data):
     data['notify_cart'] = True
-    return requests.post(f"{url}/order/{order_id}/shipping_info", data=json.dumps(data), headers=__get_headers())
+    # Posting the same shipping info again just overwrites it, so it's safe to retry
+    return __session().post(
+        f"{__get_url()}/order/{order_id}/shipping_info", data=json.dumps(data), headers=__get_headers(), idempotent=True,
+        endpoint='POST /order/shipping_info')
 
 
 def get_supplier_sku(product_obj, supplier_id):
@@ -101,37 +363,70 @@ def get_supplier_sku(product_obj, supplier_id):
     return return_sku
 
 
-def get_product_list(lines, supplier_id):
-    return_list = []
-    for line in lines:
-        # Get the ordoro SKU
-        ord_sku = line['sku']
+def __get_product_entry(sku, index):
+    entry = index.get(sku) if index is not None else None
+
+    if entry is None:
+        # Not in the index (or the index is off), e.g. a product added since the last refresh
+        entry = product_index.entry_from_product(get_product(sku))
+        if index is not None:
+            index.put(sku, entry)
+
+    return entry
+
+
+def __expand_product(sku, qty, supplier_id, index, return_list, kits=()):
+    entry = __get_product_entry(sku, index)
+
+    # If it's a kit, add each of its components, which can be kits themselves
+    if entry.is_kit:
+        if sku in kits:
+            raise errors.KitCycleFound(sku)
+
+        for component_sku, component_qty in entry.components:
+            # quantity needed = quantity included in kit * kit quantity
+            __expand_product(component_sku, int(component_qty * qty), supplier_id, index, return_list, kits + (sku,))
+        return
 
-        # Get the product from ordoro
-        product = get_product(ord_sku)
+    supplier_sku = entry.supplier_skus.get(supplier_id)
+    if supplier_sku is None:
+        raise errors.SupplierSKUNotFound(sku)
 
-        # If it's a kit...
-        if product['is_kit_parent']:
-            # Get kit quantity
-            kit_qty = line['quantity']
+    return_list.append(order_model.Line(supplier_sku, qty))
 
-            # Loop through kit_components
-            for component in product['kit_components']:
-                # Get product object from ordoro for each product
-                component_obj = get_product(component['sku'])
 
-                component_sku = get_supplier_sku(component_obj, supplier_id)
+def __product_supplier_ids(sku, index, kits=()):
+    entry = __get_product_entry(sku, index)
 
-                # Get the quantity of the product included in the kit
-                component_qty = component['quantity']
+    if not entry.is_kit:
+        return set(entry.supplier_skus)
 
-                # quantity needed = quantity included in kit * kit quantity
-                needed_qty = int(component_qty * kit_qty)
+    if sku in kits:
+        raise errors.KitCycleFound(sku)
 
-                # Add product to parsed_order['Parts']
-                return_list.append({'sku': component_sku, 'qty': needed_qty})
-        else:
-            # If not a kit, just add the supplier sku and quantity to the order
-            sku = get_supplier_sku(product, supplier_id)
-            return_list.append({'sku': sku, 'qty': line['quantity']})
+    # A kit can only come from a supplier that has every one of its components
+    supplier_ids = None
+    for component_sku, component_qty in entry.components:
+        component_ids = __product_supplier_ids(component_sku, index, kits + (sku,))
+        supplier_ids = component_ids if supplier_ids is None else supplier_ids & component_ids
+    return supplier_ids or set()
+
+
+def get_line_supplier_ids(lines):
+    # Ids of the suppliers that have a SKU for everything on the order lines
+    index = get_product_index() if config.product_index else None
+
+    supplier_ids = None
+    for line in lines:
+        line_ids = __product_supplier_ids(line.sku, index)
+        supplier_ids = line_ids if supplier_ids is None else supplier_ids & line_ids
+    return supplier_ids or set()
+
+
+def get_product_list(lines, supplier_id):
+    index = get_product_index() if config.product_index else None
+
+    return_list = []
+    for line in lines:
+        __expand_product(line.sku, line.quantity, supplier_id, index, return_list)
     return return_list
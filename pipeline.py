@@ -0,0 +1,369 @@
+import concurrent.futures
+import functools
+import logging
+import queue
+import threading
+import time
+import requests
+import audit
+import config
+import clients
+import errors
+import metrics
+import ordoro
+import shards
+import state
+import submissions
+import suppliers
+import workers
+
+logger = logging.getLogger('process-dropships')
+
+
+def submit_order(adapter, order, writes):
+    try:
+        __submit_order(adapter, order, writes)
+    finally:
+        # However it went, all of the order's Ordoro changes are in, so they can go out together
+        writes.done(order.order_number)
+
+
+def __submit_order(adapter, order, writes):
+    order_number = order.order_number
+
+    # Determine if order should be skipped based on what mode we're in
+    if config.should_skip(order_number):
+        logger.info(f"Skipping order {order_number}.")
+        return
+
+    logger.info(f"Processing order {order_number}...")
+
+    try:
+        product_list = ordoro.get_product_list(order.lines, adapter.supplier_id)
+    except (errors.SupplierSKUNotFound, errors.KitCycleFound) as e:
+        logger.error(f"Error: {e.msg()}")
+        logger.error("Unable to parse product list. Skipping order.")
+        return
+
+    payload = adapter.build_order(order, product_list)
+
+    # Don't send it again if an earlier run already did
+    if not submissions.start(order, adapter.name, writes, adapter.order_id_comment):
+        return
+
+    logger.info(f"Sending order {order_number} to {adapter.label}...")
+    logger.debug(f"{payload}")
+
+    try:
+        r = adapter.submit(payload)
+    except requests.exceptions.ConnectionError as err:
+        if clients.never_connected(err):
+            logger.error(f"Error! Unable to connect to {adapter.label}. Skipping order.")
+            submissions.not_sent(order_number, adapter.name)
+            return
+
+        # Dropped after connecting, the supplier may have read the order first
+        logger.error(f"Error! Lost the connection to {adapter.label}. The order may have gone through.")
+        submissions.failed(order_number, adapter.name, writes, "connection dropped, may have gone through")
+        return
+    except requests.exceptions.Timeout:
+        # The supplier may still have received the order, so don't leave it to be resubmitted
+        logger.error(f"Error! {adapter.label} did not respond in time. The order may have gone through.")
+        submissions.failed(order_number, adapter.name, writes, "no response in time, may have gone through")
+        return
+    except requests.exceptions.RequestException as err:
+        logger.error(f"Error! Unable to submit order to {adapter.label}: {err}. Skipping order.")
+        submissions.not_sent(order_number, adapter.name)
+        return
+
+    if clients.was_rejected(r):
+        logger.error(f"Error! {adapter.label} is unavailable right now ({r.status_code}). "
+                     f"Leaving order for the next run.")
+        submissions.not_sent(order_number, adapter.name)
+        return
+
+    if r.status_code >= 500:
+        # Same as a timeout, the supplier may have taken the order before the error
+        logger.error(f"Error! {adapter.label} answered {r.status_code}. The order may have gone through.")
+        submissions.failed(order_number, adapter.name, writes, f"{r.status_code} from supplier, may have gone through")
+        return
+
+    logger.info(f"Parsing response from {adapter.label}...")
+
+    try:
+        supplier_order_ids = adapter.parse_response(r)
+    except errors.SupplierRejected as e:
+        logger.error(f"Error! {e.msg()}")
+        submissions.failed(order_number, adapter.name, writes, e.reason)
+        return
+    except Exception as err:
+        logger.error(f"Error parsing response. Exception:"
+                     f"\n\r{err}"
+                     f"\n\rLast Response:"
+                     f"\n\r{r.text}")
+        submissions.failed(order_number, adapter.name, writes, f"unreadable response: {err}")
+        return
+
+    logger.info(f"Order submitted successfully. {adapter.label} order ID: {', '.join(supplier_order_ids)}")
+    submissions.accepted(order, adapter.name, supplier_order_ids, writes, adapter.order_id_comment)
+
+    logger.info(f"Done submitting order {order_number}.\n\r")
+
+
+def __tracking_due(adapter, order):
+    order_number = order.order_number
+
+    # Determine if order should be skipped based on what mode we're in
+    if config.should_skip(order_number):
+        logger.info(f"Skipping order {order_number}.\n\r")
+        return False
+
+    if not state.tracking_due(order_number, adapter.name, order.order_placed_date):
+        logger.info(f"Checked {order_number} recently, not due for another check yet. Skipping.\n\r")
+        return False
+
+    return True
+
+
+def __fetch_tracking_batch(adapter, batch, results):
+    if not batch:
+        return
+
+    # The supplier's order IDs were recorded when the order was submitted. Orders submitted before that was
+    # done have them looked up from the order (e.g. Meyer's comments) instead, and recorded for next time.
+    supplier_order_ids = state.get_supplier_orders([order.order_number for order in batch], adapter.name)
+    for order in batch:
+        if order.order_number not in supplier_order_ids:
+            supplier_order_ids[order.order_number] = adapter.supplier_order_ids(order)
+            if supplier_order_ids[order.order_number]:
+                state.record_supplier_orders(order.order_number, adapter.name, supplier_order_ids[order.order_number])
+
+    for order_number, ids in supplier_order_ids.items():
+        state.record_tracking_poll(order_number, adapter.name, ids)
+
+    logger.info(f"Requesting tracking info for {len(batch)} orders from {adapter.label}...")
+    results.update(adapter.fetch_tracking_batch(batch, supplier_order_ids))
+
+    yield from batch
+
+
+def prefetch_tracking(adapter, orders, results):
+    # Yields the orders that are due a tracking check, once their tracking has been fetched from the supplier
+    # tracking_batch_size orders at a time. Fills results with {order_number: [Tracking, ...] or the exception
+    # fetching it raised} for track_order to pick up.
+    batch = []
+    for order in orders:
+        if not __tracking_due(adapter, order):
+            continue
+
+        # Taken before the supplier is asked, so two runners never fetch and record the same order's tracking.
+        # workers.run_one claims it again, which only renews a lease this process already holds.
+        if not shards.claim(order.order_number, metrics.current_phase.get()):
+            logger.info(f"Order {order.order_number} is being handled by another runner. Skipping.\n\r")
+            continue
+
+        batch.append(order)
+        if len(batch) >= config.tracking_batch_size:
+            yield from __fetch_tracking_batch(adapter, batch, results)
+            batch = []
+
+    yield from __fetch_tracking_batch(adapter, batch, results)
+
+
+def track_order(adapter, order, writes, results):
+    try:
+        __track_order(adapter, order, writes, results)
+    finally:
+        writes.done(order.order_number)
+
+
+def __track_order(adapter, order, writes, results):
+    order_number = order.order_number
+
+    logger.info(f"Processing order {order_number}...")
+
+    records = results.pop(order_number, [])
+    if isinstance(records, requests.exceptions.RequestException):
+        logger.error(f"Error! Unable to reach {adapter.label}: {records}. Skipping order.\n\r")
+        return
+    if isinstance(records, Exception):
+        logger.error(f"Error! Unable to read tracking info from {adapter.label}: {records}. Skipping order.\n\r")
+        return
+
+    # Records without a tracking number (or carrier) aren't any use to Ordoro
+    records = [record for record in records if record.tracking_number and record.carrier]
+
+    if not records:
+        logger.info("No tracking info yet, skipping.\n\r")
+        return
+
+    logger.info(f"{len(records)} tracking numbers received.")
+
+    # The first tracking number is added as the official shipping method, the rest as comments
+    data = {
+        'tracking_number': records[0].tracking_number,
+        'ship_date': records[0].ship_date or order.order_placed_date,
+        'carrier_name': records[0].carrier,
+        'shipping_method': adapter.shipping_method,
+        'cost': adapter.shipping_cost
+    }
+
+    logger.info(f"Applying {data['tracking_number']} as official shipping method...")
+    logger.debug(f"{data}")
+
+    shipping_r = ordoro.post_shipping_info(order_number, data)
+    if not shipping_r.ok:
+        logger.error(f"Error! Ordoro didn't accept the shipping info ({shipping_r.status_code}). "
+                     f"Leaving order for the next run.\n\r")
+        return
+
+    audit.event('tracked', order_number, adapter.name, carrier=data['carrier_name'], ship_date=data['ship_date'],
+                tracking_numbers=[record.tracking_number for record in records])
+
+    logger.info("Removing 'Awaiting Tracking' tag...")
+    writes.delete_tag_await_track(order_number)
+    # Polling stops only once the tag is off, batched or not
+    writes.after(order_number, state.forget_tracking, adapter.name)
+
+    for record in records[1:]:
+        logger.info(f"Applying {record.tracking_number} in a comment...")
+        writes.post_comment(order_number, adapter.tracking_comment(record))
+
+    logger.info(f"Finished applying tracking for Ordoro order {order_number}.\n\r")
+
+
+def __recover_submissions(adapter, started, writes):
+    num_recovered = submissions.recover(adapter.name, started, writes, adapter.order_id_comment)
+    if num_recovered > 0:
+        logger.info(f"Finished {num_recovered} {adapter.label} submissions left over from earlier runs.")
+
+
+def submit_dropships(adapter, orders=None):
+    # orders are fetched from Ordoro for just this supplier, unless they're passed in already (see route())
+    if orders is None:
+        logger.info(f"Requesting all {adapter.label} orders with 'Dropship Ready' from Ordoro...")
+        orders = ordoro.get_dropship_ready_orders(adapter.supplier_id)
+
+    # Process orders as their pages come in
+    started = time.time()
+    writes = ordoro.mutations()
+    try:
+        num_orders = workers.run(
+            orders, functools.partial(submit_order, adapter, writes=writes), adapter.concurrency,
+            f"{adapter.name}.submit")
+        __recover_submissions(adapter, started, writes)
+    finally:
+        # Orders already sent keep their tags even if the phase stops part way
+        writes.flush()
+
+    logger.info(f"Done submitting {adapter.label} dropships. {num_orders} orders found.\n\r")
+
+
+def get_tracking(adapter, orders=None):
+    # orders are fetched from Ordoro for just this supplier, unless they're passed in already (see route())
+    if orders is None:
+        logger.info(f"Requesting all {adapter.label} orders with 'Awaiting Tracking' from Ordoro...")
+        orders = ordoro.get_await_track_orders(adapter.supplier_id)
+
+    results = dict()
+    writes = ordoro.mutations()
+    try:
+        num_orders = workers.run(
+            prefetch_tracking(adapter, orders, results),
+            functools.partial(track_order, adapter, writes=writes, results=results), adapter.concurrency,
+            f"{adapter.name}.track")
+    finally:
+        writes.flush()
+
+    logger.info(f"Finished getting tracking info from {adapter.label}. {num_orders} orders were due a check.\n\r")
+
+
+def __route_order(order, adapters):
+    # Goes by the supplier Ordoro has the order set to drop ship from, or failing that,
+    # the one supplier that has every product on the order
+    supplier_id = order.supplier_id
+    if supplier_id is not None:
+        matches = [adapter for adapter in adapters if adapter.supplier_id == supplier_id]
+    else:
+        supplier_ids = ordoro.get_line_supplier_ids(order.lines)
+        matches = [adapter for adapter in adapters if adapter.supplier_id in supplier_ids]
+
+    if len(matches) == 1:
+        return matches[0]
+
+    if supplier_id is None and matches:
+        logger.error(f"Error! More than one supplier could take order {order.order_number}. "
+                     f"Set its drop ship supplier in Ordoro.")
+    return None
+
+
+def route(orders, adapters):
+    # Splits one order listing between the suppliers. Returns {adapter name: orders}, fed from a
+    # background thread as pages come in, so each supplier can start on its first order right away.
+    queues = {adapter.name: queue.Queue() for adapter in adapters}
+
+    # Orders are matched against every supplier, not just the ones in this run, so a run for one supplier
+    # doesn't take an order that a full run would turn away as ambiguous
+    all_adapters = suppliers.get()
+
+    def feed():
+        try:
+            for order in orders:
+                # Not worth looking up products for an order the phase would skip anyway
+                if config.should_skip(order.order_number):
+                    continue
+
+                try:
+                    adapter = __route_order(order, all_adapters)
+                except Exception as err:
+                    logger.error(f"Error! Unable to tell which supplier order {order.order_number} is for: {err}")
+                    continue
+
+                if adapter is not None and adapter.name in queues:
+                    queues[adapter.name].put(order)
+        except Exception:
+            logger.exception("Error! Unable to get orders from Ordoro.")
+        finally:
+            for orders_queue in queues.values():
+                orders_queue.put(None)
+
+    threading.Thread(target=metrics.carry_phase(feed), daemon=True).start()
+
+    return {name: iter(orders_queue.get, None) for name, orders_queue in queues.items()}
+
+
+def run(submit, track, supplier_names=None):
+    # Runs the submit and/or tracking phases for every registered supplier (or just the ones named).
+    # With use_engine they all run at once (see engine.run), otherwise one after the other.
+    # With combined_fetch each listing is fetched once for all suppliers and split between them (see route()),
+    # and the suppliers in a phase always run side by side.
+    adapters = suppliers.get(supplier_names)
+
+    phases = []
+    if submit:
+        phases.append((submit_dropships, ordoro.get_dropship_ready_orders))
+    if track:
+        phases.append((get_tracking, ordoro.get_await_track_orders))
+
+    if config.use_engine:
+        import engine
+
+        calls = []
+        for phase, get_orders in phases:
+            if config.combined_fetch:
+                routed = route(get_orders(), adapters)
+                calls = calls + [functools.partial(phase, adapter, routed[adapter.name]) for adapter in adapters]
+            else:
+                calls = calls + [functools.partial(phase, adapter) for adapter in adapters]
+        engine.run(*calls)
+        return
+
+    for phase, get_orders in phases:
+        if config.combined_fetch:
+            routed = route(get_orders(), adapters)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(adapters)) as executor:
+                for future in [executor.submit(phase, adapter, routed[adapter.name]) for adapter in adapters]:
+                    future.result()
+        else:
+            for adapter in adapters:
+                phase(adapter)
@@ -1,59 +1,277 @@
+import argparse
 import datetime
+import json
 import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import audit
 import config as cfg
-import taw
-import meyer
+import metrics
+
+# The supplier modules, ordoro and requests are only imported once a run needs them, so --help, the menu
+# and a scheduled run that has nothing to do start quickly
 
-log_file = f"LOG-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
 logger = logging.getLogger('process-dropships')
-logger.setLevel(logging.INFO)
-logger.addHandler(logging.FileHandler(log_file))
-logger.addHandler(logging.StreamHandler())
 
 
-def submit_dropships():
-    taw.submit_dropships()
-    meyer.submit_dropships()
+def setup_logging():
+    logger.setLevel(logging.INFO)
+
+    # Opened on the first line logged, so a run that logs nothing doesn't leave an empty file behind. Written
+    # from a queue, so a slow disk (or rotating the file) doesn't hold up the orders being processed.
+    if cfg.log_file:
+        log_file = audit.shard_file(datetime.datetime.now().strftime(cfg.log_file))
+        logger.addHandler(audit.queued(audit.RotatingFileHandler(
+            log_file, cfg.log_file_max_bytes, cfg.log_file_rotate_seconds, cfg.log_file_backups)))
+    logger.addHandler(logging.StreamHandler())
+
+
+def log_cache_stats():
+    import ordoro
+
+    stats = ordoro.get_product_cache().stats()
+    logger.info(f"Product cache: {stats['hits'] + stats['disk_hits']} lookups saved "
+                f"({stats['hits']} memory, {stats['disk_hits']} disk), {stats['misses']} fetched from Ordoro.\n\r")
+
+
+def log_run_summary(run_summary=None):
+    run_summary = metrics.write(cfg.metrics_file, cfg.metrics_prometheus_file, run_summary)
+
+    # Point at whichever upstream calls took the most time overall
+    slowest = sorted(run_summary['calls'], key=lambda call: call['total'], reverse=True)[:3]
+    for call in slowest:
+        logger.info(f"{call['upstream']} {call['endpoint']} ({call['phase']}): {call['count']} calls, "
+                    f"{call['errors']} errors, {call['total']:.1f}s total, {call['mean'] * 1000:.0f}ms avg")
+    logger.info(f"Run took {run_summary['duration']:.1f}s.\n\r")
+
+
+def log_profile(profiler):
+    wall_path, cpu_path = profiler.write(cfg.profile_file)
+    logger.info(f"Profile: {profiler.duration:.1f}s wall, {profiler.process_cpu:.1f}s CPU. "
+                f"Collapsed stacks written to {wall_path} (wall time) and {cpu_path} (CPU time).")
+
+    # Thread time adds up across threads, so a phase running 8 orders at once can show 8x its wall time
+    for phase, times in sorted(profiler.phases().items()):
+        if times['wall'] < 0.05:
+            continue
+
+        network = sum(times['network'].values())
+        upstreams = ', '.join(f"{upstream} {seconds:.1f}s" for upstream, seconds in sorted(times['network'].items()))
+        logger.info(f"{phase}: {times['wall']:.1f}s thread time, {times['cpu']:.1f}s CPU, "
+                    f"{network:.1f}s network ({upstreams or 'no calls'}), "
+                    f"{max(times['wall'] - times['cpu'] - network, 0):.1f}s other waiting")
+    logger.info("")
+
+
+def process(submit, track, supplier_names=None):
+    import pipeline
+
+    metrics.reset()
+
+    profiler = None
+    if cfg.profile_file:
+        import profiling
+
+        profiler = profiling.Sampler(cfg.profile_interval)
+        profiler.start()
+
+    try:
+        pipeline.run(submit, track, supplier_names)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+    if submit:
+        log_cache_stats()
+
+    if profiler is not None:
+        log_profile(profiler)
+
+    log_run_summary()
+
+
+def process_sharded(submit, track, supplier_names, processes):
+    # Runs each shard as its own copy of this script, then reports the run as a whole
+    command = 'all' if submit and track else 'submit' if submit else 'track'
+
+    with tempfile.TemporaryDirectory(prefix='dropships-shards-') as workdir:
+        shard_metrics = [Path(workdir) / f"shard-{i}.json" for i in range(processes)]
 
+        children = []
+        for i in range(processes):
+            args = [sys.executable, __file__, command, '--shard', f"{i}/{processes}",
+                    '--mode', 'test' if cfg.test else 'live', '--metrics-file', str(shard_metrics[i])]
+            for name in supplier_names or []:
+                args = args + ['--supplier', name]
+            if cfg.http_traffic:
+                args = args + [f"--{cfg.http_traffic}", cfg.http_traffic_db, '--replay-speed', str(cfg.http_replay_speed)]
+            if cfg.profile_file:
+                profile_file = Path(cfg.profile_file)
+                shard_profile = profile_file.with_name(f"{profile_file.stem}-shard{i}{profile_file.suffix}")
+                args = args + ['--profile', str(shard_profile)]
+            children.append(subprocess.Popen(args))
 
-def get_tracking():
-    taw.get_tracking()
-    meyer.get_tracking()
+        logger.info(f"Started {processes} shard processes, waiting for them to finish...\n\r")
 
+        run_summaries = []
+        for i, child in enumerate(children):
+            if child.wait() != 0:
+                logger.error(f"Error! Shard {i} exited with status {child.returncode}.")
 
-# Sets credentials in config based on 'test' flag
-cfg.setup_env()
+            if shard_metrics[i].exists():
+                with open(shard_metrics[i]) as f:
+                    run_summaries.append(json.load(f))
 
-inp = ''
+    log_run_summary(metrics.merge(run_summaries))
 
-while inp.lower() != 'q':
-    if cfg.test:
-        print("\n\r*** TEST MODE ***")
-    else:
-        print("\n\r!!! LIVE MODE !!!")
-    print("What would you like to do?\n\r")
-    print("\t1 Submit Drophships")
-    print("\t2 Get Tracking Info")
-    print("\t3 Both")
-    print("\t4 Switch between LIVE and TEST modes")
-    print("\tq Quit\n\r")
+
+def watch(submit, track, supplier_names, interval, processes=1):
+    logger.info(f"Checking Ordoro for orders every {interval} seconds. Press Ctrl+C to stop.\n\r")
 
     while True:
-        print("=> ", end='')
-        inp = input()
+        started = time.monotonic()
+
+        try:
+            if processes > 1:
+                process_sharded(submit, track, supplier_names, processes)
+            else:
+                process(submit, track, supplier_names)
+        except Exception:
+            # Ordoro being down for one pass shouldn't stop the daemon
+            logger.exception("Error! Run failed. Trying again next interval.\n\r")
+
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+def menu(supplier_names):
+    inp = ''
+
+    while inp.lower() != 'q':
+        if cfg.test:
+            print("\n\r*** TEST MODE ***")
+        else:
+            print("\n\r!!! LIVE MODE !!!")
+        print("What would you like to do?\n\r")
+        print("\t1 Submit Drophships")
+        print("\t2 Get Tracking Info")
+        print("\t3 Both")
+        print("\t4 Switch between LIVE and TEST modes")
+        print("\tq Quit\n\r")
+
+        while True:
+            print("=> ", end='')
+            inp = input()
+
+            if inp.lower() == 'q':
+                exit()
+
+            if inp == '4':
+                cfg.switch_modes()
+
+            if inp in ['1', '2', '3']:
+                process(inp in ['1', '3'], inp in ['2', '3'], supplier_names)
+
+            if inp in ['1', '2', '3', '4']:
+                inp = ''
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Submits 'Dropship Ready' Ordoro orders to suppliers and applies tracking to 'Awaiting Tracking' "
+                    "orders. Without a command, shows the interactive menu.")
+    parser.add_argument('command', nargs='?', choices=['submit', 'track', 'all'],
+                        help="submit dropships, get tracking, or both, then exit (or keep going with --watch)")
+    parser.add_argument('--supplier', action='append', choices=cfg.supplier_modules,
+                        help="only process this supplier, can be given more than once (default: all)")
+    parser.add_argument('--mode', choices=['live', 'test'],
+                        help="overrides 'test' in config")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running, checking Ordoro for new orders every --interval seconds")
+    parser.add_argument('--interval', type=int, default=cfg.watch_interval,
+                        help=f"seconds between checks with --watch (default: {cfg.watch_interval})")
+    parser.add_argument('--processes', type=int, default=cfg.shard_processes,
+                        help=f"split orders across this many processes (default: {cfg.shard_processes})")
+    parser.add_argument('--shard', metavar='I/N',
+                        help="only handle shard I of N (counting from 0), e.g. to split runs across hosts")
+    parser.add_argument('--metrics-file', default=cfg.metrics_file,
+                        help=f"where to write the run's metrics (default: {cfg.metrics_file})")
+    parser.add_argument('--record', metavar='FILE',
+                        help="save every call to Ordoro, TAW and Meyer (minus credentials) to FILE")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="answer calls from a file saved with --record instead of the network")
+    parser.add_argument('--replay-speed', type=float, default=cfg.http_replay_speed,
+                        help="replay calls this many times faster than recorded, 0 for no waiting "
+                             f"(default: {cfg.http_replay_speed})")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="sample where the run's time goes, writing flamegraph-ready stacks to FILE "
+                             "and logging wall, CPU and network time by phase")
+    args = parser.parse_args()
+
+    if (args.watch or args.processes > 1 or args.shard) and args.command is None:
+        parser.error("--watch, --processes and --shard need a command (submit, track or all)")
+
+    if args.shard:
+        try:
+            cfg.shard_index, cfg.shard_count = [int(part) for part in args.shard.split('/')]
+        except ValueError:
+            parser.error("--shard should look like 0/4")
+        if not 0 <= cfg.shard_index < cfg.shard_count:
+            parser.error("--shard I/N needs 0 <= I < N")
+
+        # Already a shard, don't split it again
+        args.processes = 1
+
+    # After --shard, so each shard logs to its own file
+    setup_logging()
+
+    cfg.metrics_file = args.metrics_file
+
+    if args.record and args.replay:
+        parser.error("--record and --replay can't be used together")
+    if args.record or args.replay:
+        cfg.http_traffic = 'record' if args.record else 'replay'
+        cfg.http_traffic_db = args.record or args.replay
+    cfg.http_replay_speed = args.replay_speed
+
+    if cfg.http_traffic == 'replay':
+        # A replayed run starts from nothing and keeps its state in memory, so it can't mark real orders as sent,
+        # polled or leased, and an earlier run's state can't change what it does
+        cfg.state_db = ':memory:'
+        cfg.product_cache_db = None
+        cfg.shard_lease_db = None
+
+    if args.profile:
+        cfg.profile_file = args.profile
+
+    if args.mode:
+        cfg.test = args.mode == 'test'
+
+    # Sets credentials in config based on 'test' flag
+    cfg.setup_env()
+
+    audit.start()
 
-        if inp.lower() == 'q':
-            exit()
+    if args.command is None:
+        menu(args.supplier)
+        return
 
-        if inp == '4':
-            cfg.switch_modes()
+    submit = args.command in ['submit', 'all']
+    track = args.command in ['track', 'all']
 
-        if inp in ['1', '3']:
-            submit_dropships()
+    try:
+        if args.watch:
+            watch(submit, track, args.supplier, args.interval, args.processes)
+        elif args.processes > 1:
+            process_sharded(submit, track, args.supplier, args.processes)
+        else:
+            process(submit, track, args.supplier)
+    except KeyboardInterrupt:
+        logger.info("Stopped.")
 
-        if inp in ['2', '3']:
-            get_tracking()
 
-        if inp in ['1', '2', '3', '4']:
-            inp = ''
-            break
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import collections
+import json
+import sqlite3
+import threading
+import time
+
+# What kit expansion needs to know about an Ordoro product. components is ((sku, quantity), ...),
+# supplier_skus is {supplier_id: supplier_sku}.
+Entry = collections.namedtuple('Entry', ['is_kit', 'components', 'supplier_skus'])
+
+
+def entry_from_product(product):
+    return Entry(
+        bool(product['is_kit_parent']),
+        tuple((component['sku'], component['quantity']) for component in product.get('kit_components') or ()),
+        {supplier['id']: supplier['supplier_sku'] for supplier in product.get('suppliers') or ()})
+
+
+class ProductIndex:
+    """
+    Every Ordoro product's kit components and supplier SKUs, held in memory and kept in SQLite between runs.
+    Loaded in bulk from Ordoro's product listing once, then refreshed with only the products changed since.
+    Test and live catalogs are kept apart by mode.
+    """
+
+    def __init__(self, mode, db_path=None):
+        self.mode = mode
+        self.refreshed_through = None
+        self.refreshed_at = 0
+
+        self.__entries = dict()
+        self.__lock = threading.Lock()
+        self.__db = None
+
+        if db_path:
+            self.__db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self.__db.executescript("""
+                CREATE TABLE IF NOT EXISTS product_index (
+                    mode TEXT,
+                    sku TEXT,
+                    is_kit INTEGER,
+                    components TEXT,
+                    supplier_skus TEXT,
+                    PRIMARY KEY (mode, sku)
+                );
+                CREATE TABLE IF NOT EXISTS product_index_refresh (
+                    mode TEXT PRIMARY KEY,
+                    refreshed_through TEXT,
+                    refreshed_at REAL
+                );""")
+            self.__load()
+
+    def get(self, sku):
+        return self.__entries.get(sku)
+
+    def put(self, sku, entry):
+        with self.__lock:
+            self.__entries[sku] = entry
+            self.__save([(sku, entry)])
+
+    def stale(self, max_age):
+        return time.time() - self.refreshed_at >= max_age
+
+    def refresh(self, fetch_products):
+        # fetch_products(updated_after) yields every product changed after updated_after (all of them for None)
+        with self.__lock:
+            changed = []
+            latest = self.refreshed_through
+
+            for product in fetch_products(self.refreshed_through):
+                entry = entry_from_product(product)
+                self.__entries[product['sku']] = entry
+                changed.append((product['sku'], entry))
+
+                updated = product.get('updated')
+                if updated and (latest is None or updated > latest):
+                    latest = updated
+
+            self.refreshed_through = latest
+            self.refreshed_at = time.time()
+            self.__save(changed)
+
+            return len(changed)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __load(self):
+        rows = self.__db.execute(
+            "SELECT sku, is_kit, components, supplier_skus FROM product_index WHERE mode = ?", (self.mode,))
+        for sku, is_kit, components, supplier_skus in rows:
+            self.__entries[sku] = Entry(
+                bool(is_kit),
+                tuple(tuple(component) for component in json.loads(components)),
+                {int(supplier_id): supplier_sku for supplier_id, supplier_sku in json.loads(supplier_skus).items()})
+
+        row = self.__db.execute(
+            "SELECT refreshed_through, refreshed_at FROM product_index_refresh WHERE mode = ?", (self.mode,)).fetchone()
+        if row is not None:
+            self.refreshed_through, self.refreshed_at = row
+
+    def __save(self, changed):
+        if self.__db is None:
+            return
+
+        self.__db.executemany(
+            "INSERT OR REPLACE INTO product_index (mode, sku, is_kit, components, supplier_skus) VALUES (?, ?, ?, ?, ?)",
+            [(self.mode, sku, int(entry.is_kit), json.dumps(entry.components), json.dumps(entry.supplier_skus))
+             for sku, entry in changed])
+        self.__db.execute(
+            "INSERT OR REPLACE INTO product_index_refresh (mode, refreshed_through, refreshed_at) VALUES (?, ?, ?)",
+            (self.mode, self.refreshed_through, self.refreshed_at))
+        self.__db.commit()
@@ -0,0 +1,154 @@
+import collections
+import sys
+import threading
+import time
+from pathlib import Path
+import clients
+import metrics
+
+repo_prefix = str(Path(__file__).resolve().parent)
+
+# Everything under this frame is waiting on an upstream, whatever the HTTP stack underneath is doing
+network_code = clients.Session.send.__code__
+
+# Stack frame labels by code object, so each sample doesn't rebuild them
+labels = dict()
+
+
+def label(code):
+    if code not in labels:
+        # co_qualname (with the class name) is only there from Python 3.11
+        labels[code] = f"{Path(code.co_filename).stem}.{getattr(code, 'co_qualname', code.co_name)}"
+    return labels[code]
+
+
+def collapse(frame):
+    # 'frame;frame;...' from the outermost of this repo's frames in, None if the thread isn't running any of our code
+    # (an idle pool thread, say)
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+
+    names = []
+    for frame in reversed(frames):
+        code = frame.f_code
+        if not names and not code.co_filename.startswith(repo_prefix):
+            continue
+
+        if code is network_code:
+            names.append(f"network:{getattr(frame.f_locals.get('self'), 'upstream', 'unknown')}")
+            break
+
+        names.append(label(code))
+
+    return ';'.join(names) or None
+
+
+class Sampler:
+    """
+    Samples every thread's stack every 'interval' seconds while it's running, to show where a run's time goes.
+    Stacks are kept under the phase the thread was in (see metrics.set_phase), weighted once by wall time and
+    once by the CPU time the thread used since the previous sample. Time under clients.Session.send is folded
+    into a single 'network:<upstream>' frame.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.wall = collections.Counter()
+        self.cpu = collections.Counter()
+        self.duration = 0.0
+        self.process_cpu = 0.0
+
+        self.__cpu_clocks = dict()
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__started = None
+        self.__process_started = None
+
+    def start(self):
+        self.__started = time.perf_counter()
+        self.__process_started = time.process_time()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+        self.duration = time.perf_counter() - self.__started
+        self.process_cpu = time.process_time() - self.__process_started
+
+    def __run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+
+        while not self.__stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed = now - last
+            last = now
+
+            cpu_clocks = dict()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                cpu = self.__cpu_used(thread_id, cpu_clocks)
+                stack = collapse(frame)
+                if stack is None:
+                    continue
+
+                key = f"{metrics.thread_phase(thread_id)};{stack}"
+                self.wall[key] = self.wall[key] + elapsed
+                if cpu:
+                    self.cpu[key] = self.cpu[key] + cpu
+
+            # Threads that have finished drop out
+            self.__cpu_clocks = cpu_clocks
+
+    def __cpu_used(self, thread_id, cpu_clocks):
+        # CPU seconds the thread has used since the last sample. Per-thread CPU clocks are POSIX only, elsewhere
+        # there's no CPU breakdown.
+        if not hasattr(time, 'pthread_getcpuclockid'):
+            return 0.0
+
+        try:
+            clock = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except OSError:
+            return 0.0
+
+        cpu_clocks[thread_id] = clock
+        return clock - self.__cpu_clocks.get(thread_id, clock)
+
+    def phases(self):
+        # {phase: {'wall': thread-seconds sampled, 'cpu': CPU seconds, 'network': {upstream: thread-seconds}}}
+        phases = dict()
+
+        for key, seconds in self.wall.items():
+            phase, stack = key.split(';', 1)
+            times = phases.setdefault(phase, {'wall': 0.0, 'cpu': 0.0, 'network': dict()})
+            times['wall'] = times['wall'] + seconds
+
+            leaf = stack.rsplit(';', 1)[-1]
+            if leaf.startswith('network:'):
+                upstream = leaf[len('network:'):]
+                times['network'][upstream] = times['network'].get(upstream, 0.0) + seconds
+
+        for key, seconds in self.cpu.items():
+            phase = key.split(';', 1)[0]
+            phases[phase]['cpu'] = phases[phase]['cpu'] + seconds
+
+        return phases
+
+    def write(self, path):
+        # Collapsed stacks, in microseconds, for flamegraph.pl, inferno or speedscope: wall time to path, CPU time
+        # next to it (profile.folded and profile.cpu.folded)
+        path = Path(path)
+        cpu_path = path.with_name(f"{path.stem}.cpu{path.suffix}")
+
+        for stacks, stacks_path in [(self.wall, path), (self.cpu, cpu_path)]:
+            with open(stacks_path, 'w') as f:
+                for key, seconds in sorted(stacks.items()):
+                    if round(seconds * 1e6) > 0:
+                        f.write(f"{key} {round(seconds * 1e6)}\n")
+
+        return path, cpu_path
@@ -0,0 +1,64 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+import config
+
+__db = None
+__lock = threading.Lock()
+
+owner = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shard_of(order_number, count):
+    # crc32 rather than hash(), which is salted per process and would give every process a different answer
+    return zlib.crc32(order_number.encode()) % count
+
+
+def mine(order_number):
+    # Whether this process's shard (shard_index of shard_count) is the one that handles the order
+    return config.shard_count <= 1 or shard_of(order_number, config.shard_count) == config.shard_index
+
+
+def __connect():
+    global __db
+
+    if __db is None:
+        __db = sqlite3.connect(config.shard_lease_db, timeout=30, check_same_thread=False)
+        __db.execute("""
+            CREATE TABLE IF NOT EXISTS lease (
+                order_number TEXT,
+                phase TEXT,
+                owner TEXT,
+                expires REAL,
+                PRIMARY KEY (order_number, phase)
+            )""")
+        __db.execute("DELETE FROM lease WHERE expires < ?", (time.time(),))
+        __db.commit()
+
+    return __db
+
+
+def claim(order_number, phase):
+    # Takes the lease on an order for a phase, so hosts sharing shard_lease_db never work the same order at once.
+    # Leases aren't given back when the order is done: another host may still be holding a listing from before
+    # the order's tags changed, so it runs out after shard_lease_ttl instead.
+    if not config.shard_lease_db:
+        return True
+
+    now = time.time()
+
+    with __lock:
+        db = __connect()
+        cursor = db.execute("""
+            INSERT INTO lease (order_number, phase, owner, expires) VALUES (?, ?, ?, ?)
+            ON CONFLICT (order_number, phase) DO UPDATE SET
+                owner = excluded.owner,
+                expires = excluded.expires
+            WHERE lease.expires < ? OR lease.owner = excluded.owner""",
+            (order_number, phase, owner, now + config.shard_lease_ttl, now))
+        db.commit()
+
+    return cursor.rowcount == 1
@@ -0,0 +1,172 @@
+import datetime
+import sqlite3
+import threading
+import config
+
+__db = None
+__lock = threading.Lock()
+
+
+def __connect():
+    global __db
+
+    if __db is None:
+        __db = sqlite3.connect(config.state_db, timeout=30, check_same_thread=False)
+        # WAL lets shard processes on the same host read while another one writes
+        __db.execute("PRAGMA journal_mode=WAL")
+        __db.executescript("""
+            CREATE TABLE IF NOT EXISTS tracking_poll (
+                order_number TEXT,
+                supplier TEXT,
+                supplier_order_ids TEXT,
+                first_poll REAL,
+                last_poll REAL,
+                attempts INTEGER,
+                PRIMARY KEY (order_number, supplier)
+            );
+            CREATE TABLE IF NOT EXISTS submission (
+                order_number TEXT,
+                supplier TEXT,
+                status TEXT,
+                supplier_order_ids TEXT,
+                updated REAL,
+                PRIMARY KEY (order_number, supplier)
+            );
+            CREATE TABLE IF NOT EXISTS supplier_order (
+                order_number TEXT,
+                supplier TEXT,
+                supplier_order_ids TEXT,
+                PRIMARY KEY (order_number, supplier)
+            );""")
+        __db.commit()
+
+    return __db
+
+
+def __order_age(order_placed_date, now):
+    try:
+        placed = datetime.datetime.fromisoformat(order_placed_date.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+    if placed.tzinfo is None:
+        placed = placed.replace(tzinfo=datetime.timezone.utc)
+
+    return now - placed.timestamp()
+
+
+def tracking_due(order_number, supplier, order_placed_date):
+    # An order is due when it has waited about half its age since the last poll, so polls get further apart
+    # (each one at ~1.5x the age of the last) the longer an order goes without tracking. Kept between
+    # track_poll_min and track_poll_max.
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+
+    with __lock:
+        row = __connect().execute(
+            "SELECT first_poll, last_poll FROM tracking_poll WHERE order_number = ? AND supplier = ?",
+            (order_number, supplier)).fetchone()
+
+    if row is None:
+        return True
+
+    first_poll, last_poll = row
+
+    age = __order_age(order_placed_date, now)
+    if age is None:
+        age = now - first_poll
+
+    interval = min(max(age / 2, config.track_poll_min), config.track_poll_max)
+
+    return now - last_poll >= interval
+
+
+def record_tracking_poll(order_number, supplier, supplier_order_ids=None):
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    ids = ','.join(supplier_order_ids) if supplier_order_ids else None
+
+    with __lock:
+        db = __connect()
+        db.execute("""
+            INSERT INTO tracking_poll (order_number, supplier, supplier_order_ids, first_poll, last_poll, attempts)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (order_number, supplier) DO UPDATE SET
+                supplier_order_ids = COALESCE(excluded.supplier_order_ids, supplier_order_ids),
+                last_poll = excluded.last_poll,
+                attempts = attempts + 1""",
+            (order_number, supplier, ids, now, now))
+        db.commit()
+
+
+def forget_tracking(order_number, supplier):
+    # Tracking was applied, the order won't be polled again
+    with __lock:
+        db = __connect()
+        db.execute("DELETE FROM tracking_poll WHERE order_number = ? AND supplier = ?", (order_number, supplier))
+        db.execute("DELETE FROM supplier_order WHERE order_number = ? AND supplier = ?", (order_number, supplier))
+        db.commit()
+
+
+def record_supplier_orders(order_number, supplier, supplier_order_ids):
+    # The supplier's order IDs for an order it took, so the tracking phase doesn't have to dig them out of the
+    # order's comments. Kept until tracking is applied.
+    with __lock:
+        db = __connect()
+        db.execute(
+            "INSERT OR REPLACE INTO supplier_order (order_number, supplier, supplier_order_ids) VALUES (?, ?, ?)",
+            (order_number, supplier, ','.join(supplier_order_ids)))
+        db.commit()
+
+
+def get_supplier_orders(order_numbers, supplier):
+    # {order_number: supplier_order_ids} for those of the orders that have them recorded
+    placeholders = ','.join('?' * len(order_numbers))
+
+    with __lock:
+        rows = __connect().execute(
+            f"SELECT order_number, supplier_order_ids FROM supplier_order "
+            f"WHERE supplier = ? AND order_number IN ({placeholders})", (supplier, *order_numbers)).fetchall()
+
+    return {order_number: ids.split(',') if ids else [] for order_number, ids in rows}
+
+
+def get_submission(order_number, supplier):
+    # (status, supplier_order_ids) of a submission that hasn't been finished off yet, None if there isn't one
+    with __lock:
+        row = __connect().execute(
+            "SELECT status, supplier_order_ids FROM submission WHERE order_number = ? AND supplier = ?",
+            (order_number, supplier)).fetchone()
+
+    if row is None:
+        return None
+
+    status, ids = row
+    return status, ids.split(',') if ids else []
+
+
+def record_submission(order_number, supplier, status, supplier_order_ids=None):
+    # 'sending' before the order goes to the supplier, 'accepted' once the supplier has taken it
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    ids = ','.join(supplier_order_ids) if supplier_order_ids else None
+
+    with __lock:
+        db = __connect()
+        db.execute(
+            "INSERT OR REPLACE INTO submission (order_number, supplier, status, supplier_order_ids, updated) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (order_number, supplier, status, ids, now))
+        db.commit()
+
+
+def unfinished_submissions(supplier, before):
+    # Submissions last touched before 'before' (a timestamp), i.e. ones a run crashed or failed partway through
+    with __lock:
+        return [order_number for order_number, in __connect().execute(
+            "SELECT order_number FROM submission WHERE supplier = ? AND updated < ?", (supplier, before))]
+
+
+def forget_submission(order_number, supplier):
+    # The order is tagged to match what the supplier did with it, nothing left to finish
+    with __lock:
+        db = __connect()
+        db.execute("DELETE FROM submission WHERE order_number = ? AND supplier = ?", (order_number, supplier))
+        db.commit()
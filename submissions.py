@@ -0,0 +1,113 @@
+import logging
+import audit
+import config
+import ordoro
+import shards
+import state
+
+logger = logging.getLogger('process-dropships')
+
+# Journal of orders sent to suppliers, so a run that dies (or an Ordoro update that fails) between the
+# supplier taking an order and the order's tags changing never gets the order sent a second time.
+#   'sending'   written before the order goes out. Still there on the next run means we don't know if it went through.
+#   'accepted'  the supplier took it, with the supplier's order IDs. The Ordoro updates are still to be made.
+# The entry is removed once the order's tags have been changed to match.
+
+
+def start(order, supplier, writes, comment_format=None):
+    # Returns True if the order should be sent to the supplier. If a previous attempt was never finished off,
+    # finishes it instead and returns False.
+    order_number = order.order_number
+
+    entry = state.get_submission(order_number, supplier)
+    if entry is None:
+        state.record_submission(order_number, supplier, 'sending')
+        return True
+
+    status, supplier_order_ids = entry
+
+    # Mark it as seen this run, so recover() leaves it alone while its Ordoro updates wait to be flushed
+    state.record_submission(order_number, supplier, status, supplier_order_ids)
+
+    if status == 'accepted':
+        logger.info(f"Order was already accepted ({', '.join(supplier_order_ids) or 'no order ID'}), "
+                    f"finishing the Ordoro updates instead of sending it again...")
+        state.record_supplier_orders(order_number, supplier, supplier_order_ids)
+        __finish_accepted(order, supplier_order_ids, writes, comment_format)
+    elif ordoro.tag_drop_ready['name'] in order.tags:
+        logger.error("Error! A previous run stopped while sending this order. It may have gone through, not sending again.")
+        failed(order_number, supplier, writes, "interrupted while sending in an earlier run")
+        return False
+
+    writes.after(order_number, state.forget_submission, supplier)
+    return False
+
+
+def accepted(order, supplier, supplier_order_ids, writes, comment_format=None):
+    # The supplier took the order. Journal that before touching Ordoro, then move the order on to 'Awaiting Tracking'.
+    state.record_submission(order.order_number, supplier, 'accepted', supplier_order_ids)
+    state.record_supplier_orders(order.order_number, supplier, supplier_order_ids)
+    audit.event('submitted', order.order_number, supplier, supplier_order_ids=supplier_order_ids)
+    __finish_accepted(order, supplier_order_ids, writes, comment_format)
+    writes.after(order.order_number, state.forget_submission, supplier)
+
+
+def failed(order_number, supplier, writes, reason):
+    # The supplier turned the order down, or might have taken it without telling us. Either way it needs a person.
+    audit.event('failed', order_number, supplier, reason=reason)
+
+    logger.info("Adding 'Dropship Failed' tag...")
+    writes.post_tag_drop_fail(order_number)
+
+    logger.info("Removing 'Dropship Ready' tag...")
+    writes.delete_tag_drop_ready(order_number)
+
+    writes.after(order_number, state.forget_submission, supplier)
+
+
+def not_sent(order_number, supplier):
+    # The supplier never got the order (couldn't connect, or it turned the request away), so it's fine to send again
+    state.forget_submission(order_number, supplier)
+
+
+def __finish_accepted(order, supplier_order_ids, writes, comment_format):
+    # Only makes the changes the order doesn't already have, so it's safe to run again for the same order
+    order_number = order.order_number
+
+    if comment_format:
+        for supplier_order_id in supplier_order_ids:
+            comment = comment_format.format(supplier_order_id)
+            if comment not in order.comments:
+                logger.info(f"Adding supplier order number {supplier_order_id} as comment...")
+                writes.post_comment(order_number, comment)
+
+    # Tag first, so the order is never left with neither tag if removing the other one fails
+    if ordoro.tag_await_track['name'] not in order.tags:
+        logger.info("Adding 'Awaiting Tracking' tag...")
+        writes.post_tag_await_track(order_number)
+
+    if ordoro.tag_drop_ready['name'] in order.tags:
+        logger.info("Removing 'Dropship Ready' tag...")
+        writes.delete_tag_drop_ready(order_number)
+
+
+def recover(supplier, before, writes, comment_format=None):
+    # Finishes off journal entries the submit phase didn't come across, e.g. an order that lost its
+    # 'Dropship Ready' tag but never got 'Awaiting Tracking'. Returns how many were recovered.
+    num_recovered = 0
+
+    for order_number in state.unfinished_submissions(supplier, before):
+        if config.should_skip(order_number) or not shards.mine(order_number):
+            continue
+
+        order = ordoro.get_order(order_number)
+        if order is None:
+            logger.error(f"Error! Unable to get order {order_number} from Ordoro to finish its submission.")
+            continue
+
+        logger.info(f"Finishing the submission of order {order_number} from an earlier run...")
+        start(order, supplier, writes, comment_format)
+        writes.done(order_number)
+        num_recovered = num_recovered + 1
+
+    return num_recovered
@@ -0,0 +1,102 @@
+import collections
+import concurrent.futures
+import importlib
+import config
+import metrics
+
+# One tracking number a supplier has for an order. Adapters can return their own records instead (TAW returns
+# taw_xml.TrackingRecord) as long as they have these four fields, as attributes or properties.
+Tracking = collections.namedtuple('Tracking', ['supplier_order_id', 'tracking_number', 'carrier', 'ship_date'])
+
+registry = dict()
+
+
+class Adapter:
+    """
+    What the shared pipeline (see pipeline.py) needs from a supplier: how to build, send and read back an
+    order, and how to get its tracking. Everything else (listing orders from Ordoro, kit expansion, the
+    submission journal, tagging, concurrency) is the pipeline's.
+    """
+
+    name = None  # Used in config ('<name>_supplier_id', '<name>_concurrency'), the state db and on the command line
+    label = None  # Used in log lines
+    order_id_comment = None  # Format for an Ordoro comment holding one of the supplier's order IDs, None for no comment
+    shipping_method = 'ground'
+    shipping_cost = 0
+
+    @property
+    def supplier_id(self):
+        # The supplier's id in Ordoro
+        return getattr(config, f"{self.name}_supplier_id")
+
+    @property
+    def concurrency(self):
+        return getattr(config, f"{self.name}_concurrency", 1)
+
+    def build_order(self, order, product_list):
+        # The request payload for an order_model.Order, product_list being [order_model.Line(supplier SKU, quantity), ...]
+        raise NotImplementedError
+
+    def submit(self, payload):
+        # Sends the payload, returns the requests.Response
+        raise NotImplementedError
+
+    def parse_response(self, r):
+        # Returns the supplier's order IDs for an accepted order, raises errors.SupplierRejected if it wasn't
+        raise NotImplementedError
+
+    def supplier_order_ids(self, order):
+        # The supplier's order IDs for an Ordoro order, if the supplier needs them to look up tracking. Only asked for
+        # orders submitted before the pipeline kept its own record of them (see state.get_supplier_orders).
+        return []
+
+    def fetch_tracking(self, order, supplier_order_ids):
+        # Every Tracking the supplier has for the order, empty if it hasn't shipped yet
+        raise NotImplementedError
+
+    def fetch_tracking_batch(self, orders, supplier_order_ids):
+        # {order_number: [Tracking, ...] or the exception fetching it raised} for a batch of orders, supplier_order_ids
+        # being {order_number: supplier_order_ids(order)}. Calls fetch_tracking for each order, tracking_fetch_concurrency
+        # at a time. Suppliers that can look up several orders in one call should override this.
+        fetched = fetch_each(lambda order: self.fetch_tracking(order, supplier_order_ids[order.order_number]), orders)
+        return {order.order_number: tracking for order, tracking in zip(orders, fetched)}
+
+    def tracking_comment(self, tracking):
+        # Comment text for tracking numbers after the first
+        return (f"Additional tracking information: "
+                f"Order ID: {tracking.supplier_order_id} "
+                f"Tracking Number: {tracking.tracking_number}")
+
+
+def fetch_each(fn, items):
+    # [fn(item) or the exception it raised, ...], up to tracking_fetch_concurrency calls at a time
+    def call(item):
+        try:
+            return fn(item)
+        except Exception as err:
+            return err
+
+    if config.tracking_fetch_concurrency <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.tracking_fetch_concurrency) as executor:
+        return list(executor.map(metrics.carry_phase(call), items))
+
+
+def register(adapter):
+    registry[adapter.name] = adapter
+    return adapter
+
+
+def load(names=None):
+    # Supplier modules register their adapter when imported. Only the ones named are loaded (all of
+    # supplier_modules by default), so a run for one supplier doesn't pay for importing the others.
+    for module in names or config.supplier_modules:
+        importlib.import_module(module)
+    return registry
+
+
+def get(names=None):
+    # An adapter's name is the name of its module
+    load(names)
+    return [registry[name] for name in (names or config.supplier_modules)]
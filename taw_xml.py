@@ -0,0 +1,124 @@
+import collections
+import datetime
+import functools
+import io
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+SubmitResult = collections.namedtuple('SubmitResult', ['status', 'order_id'])
+
+
+class TrackingRecord(
+        collections.namedtuple('TrackingRecord', ['invoice_number', 'tracking_number', 'carrier', 'order_date'])):
+    """One <Record> from a GetTrackingInfo response, fields already stripped."""
+
+    __slots__ = ()
+
+    # The fields the pipeline reads from a suppliers.Tracking
+    @property
+    def supplier_order_id(self):
+        return self.invoice_number
+
+    @property
+    def ship_date(self):
+        # None if TAW left the date blank or sent one we can't read, the pipeline then uses the order date
+        if not self.order_date:
+            return None
+
+        try:
+            return to_ordoro_date(self.order_date)
+        except ValueError:
+            return None
+
+
+def __text(value):
+    # Ordoro sends None for blank address lines, TAW wants them empty
+    value = '' if value is None else str(value)
+
+    # Most values need no escaping, so skip the replace calls for them
+    if '&' in value or '<' in value or '>' in value:
+        return escape(value)
+    return value
+
+
+def __attr(value):
+    value = __text(value)
+    if '"' in value:
+        return value.replace('"', '&quot;')
+    return value
+
+
+def write_order(write, order, parts, special_instructions=None):
+    # Writes one TAW <Order> document through 'write', for an order_model.Order and the TAW parts for its lines
+    # (order_model.Line, see ordoro.get_product_list)
+    ship_to = order.shipping_address
+
+    write(
+        f"<?xml version='1.0' ?><Order>"
+        f"<PONumber>{__text(order.order_number)}</PONumber>"
+        f"<ReqDate>{__text(order.order_placed_date)}</ReqDate>"
+        f"<ShipTo>"
+        f"<Name>{__text(ship_to.name)}</Name>"
+        f"<Address>{__text(ship_to.street1)}</Address>"
+        f"<Address>{__text(ship_to.street2)}</Address>"
+        f"<City>{__text(ship_to.city)}</City>"
+        f"<State>{__text(ship_to.state)}</State>"
+        f"<Zip>{__text(ship_to.zip)}</Zip>"
+        f"<Country>{__text(ship_to.country)}</Country>"
+        f"</ShipTo>")
+
+    write(''.join([
+        f'<Part Number="{__attr(part.sku)}"><Qty>{__text(part.quantity)}</Qty></Part>' for part in parts]))
+
+    if special_instructions:
+        write(f"<SpecialInstructions>{__text(special_instructions)}</SpecialInstructions>")
+
+    write("</Order>")
+
+
+def serialize_order(order, parts, special_instructions=None):
+    buf = io.StringIO()
+    write_order(buf.write, order, parts, special_instructions)
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=256)
+def to_ordoro_date(order_date):
+    # TAW dates look like 01/31/2024, and most records in a run share a handful of them
+    return datetime.datetime.strptime(order_date, '%m/%d/%Y').strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def parse_submit_response(content):
+    status = None
+    order_id = None
+
+    for event, elem in ET.iterparse(io.BytesIO(content)):
+        if elem.tag == 'Status':
+            status = elem.text
+        elif elem.tag == 'Order':
+            order_id = elem.get('Id')
+
+    if status == 'PASS' and order_id is None:
+        raise ValueError("TAW returned PASS without an order ID")
+
+    return SubmitResult(status, order_id)
+
+
+def iter_tracking_records(content):
+    # Reads the <Record>s out of a GetTrackingInfo response one at a time, dropping each element once it's read so
+    # the whole tree is never built. The response body itself is already in memory.
+    root = None
+
+    for event, elem in ET.iterparse(io.BytesIO(content), events=('start', 'end')):
+        if root is None:
+            root = elem
+            continue
+
+        if event == 'end' and elem.tag == 'Record':
+            fields = {child.tag: (child.text or '').strip() for child in elem}
+            yield TrackingRecord(
+                fields.get('InvoiceNumber', ''),
+                fields.get('TrackNum', ''),
+                fields.get('Type', ''),
+                fields.get('OrderDate', ''))
+            root.clear()
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules under test import 'config', built here from config.py.SAMPLE the same way the benches build it.
+# Nothing listens on port 9, so a test that reaches for the network fails rather than calling a real API.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bench'))
+import mocks
+
+mocks.load_config('http://127.0.0.1:9', state_db=':memory:', product_cache_db=None, metrics_file=None)
+
+import state
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    # Every test starts with an empty in-memory state database
+    state.__db = None
+    yield
+    state.__db = None
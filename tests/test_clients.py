@@ -0,0 +1,126 @@
+import pytest
+import requests
+import requests.adapters
+import urllib3.exceptions
+
+import clients
+
+
+class Upstream(requests.adapters.BaseAdapter):
+    """Answers each call with the next of 'outcomes': a status code, (status code, headers) or an exception."""
+
+    def __init__(self, outcomes):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls = self.calls + 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        status_code, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        r = requests.Response()
+        r.status_code = status_code
+        r.headers.update(headers)
+        r.request = request
+        r.url = request.url
+        r._content = b''
+        return r
+
+    def close(self):
+        pass
+
+
+def session(*outcomes, max_retries=3):
+    upstream = Upstream(outcomes)
+    s = clients.Session('test', 1, clients.RateLimiter(1000), max_retries, backoff=0)
+    s.mount('http://', upstream)
+    return s, upstream
+
+
+def test_get_is_retried_until_it_succeeds():
+    s, upstream = session(503, 502, 200)
+
+    assert s.get('http://upstream/orders').status_code == 200
+    assert upstream.calls == 3
+
+
+def test_get_gives_up_after_max_retries():
+    s, upstream = session(503, 503, 503, 503, max_retries=2)
+
+    assert s.get('http://upstream/orders').status_code == 503
+    assert upstream.calls == 3
+
+
+def test_client_errors_are_not_retried():
+    s, upstream = session(404, 200)
+
+    assert s.get('http://upstream/orders').status_code == 404
+    assert upstream.calls == 1
+
+
+# A POST that got a 5xx may still have been acted on, so it's only sent once
+@pytest.mark.parametrize('status_code', [500, 502, 503, 504])
+def test_post_is_not_retried_after_a_server_error(status_code):
+    s, upstream = session(status_code, 200)
+
+    assert s.post('http://upstream/orders').status_code == status_code
+    assert upstream.calls == 1
+
+
+def test_post_is_retried_after_429():
+    s, upstream = session((429, {'Retry-After': '0'}), 200)
+
+    assert s.post('http://upstream/orders').status_code == 200
+    assert upstream.calls == 2
+
+
+def test_post_marked_idempotent_is_retried():
+    s, upstream = session(503, 200)
+
+    assert s.post('http://upstream/orders', idempotent=True).status_code == 200
+    assert upstream.calls == 2
+
+
+def test_get_is_retried_after_a_connection_error():
+    s, upstream = session(requests.exceptions.ConnectionError(), 200)
+
+    assert s.get('http://upstream/orders').status_code == 200
+    assert upstream.calls == 2
+
+
+def test_post_is_not_retried_after_a_connection_error():
+    s, upstream = session(requests.exceptions.ConnectionError(), 200)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        s.post('http://upstream/orders')
+    assert upstream.calls == 1
+
+
+@pytest.mark.parametrize('status_code, headers, rejected', [
+    (429, {}, True),
+    (503, {'Retry-After': '30'}, True),
+    (503, {}, False),
+    (502, {}, False),
+    (500, {}, False),
+])
+def test_was_rejected(status_code, headers, rejected):
+    r = requests.Response()
+    r.status_code = status_code
+    r.headers.update(headers)
+
+    assert clients.was_rejected(r) == rejected
+
+
+@pytest.mark.parametrize('err, never_connected', [
+    (requests.exceptions.ConnectTimeout(), True),
+    (requests.exceptions.ConnectionError(urllib3.exceptions.MaxRetryError(
+        None, '/orders', urllib3.exceptions.NewConnectionError(None, 'Connection refused'))), True),
+    (requests.exceptions.ConnectionError(urllib3.exceptions.ProtocolError(
+        'Connection aborted.', ConnectionResetError())), False),
+    (requests.exceptions.ConnectionError(), False),
+])
+def test_never_connected(err, never_connected):
+    assert clients.never_connected(err) == never_connected
@@ -0,0 +1,80 @@
+import concurrent.futures
+import random
+import threading
+
+import pytest
+
+import ordoro
+
+
+class Response:
+    def __init__(self, ok):
+        self.ok = ok
+        self.status_code = 200 if ok else 500
+
+
+class Upstream:
+    """Stand-in for the Ordoro tag calls, rejecting post_tag_await_track for the orders in 'failing'."""
+
+    def __init__(self, monkeypatch, failing):
+        self.failing = failing
+        self.calls = []
+        self.forgotten = []
+        self.lock = threading.Lock()
+
+        monkeypatch.setattr(ordoro, 'post_tag_await_track', self.change('post_tag_await_track'))
+        monkeypatch.setattr(ordoro, 'delete_tag_drop_ready', self.change('delete_tag_drop_ready'))
+
+    def change(self, name):
+        def fn(order_id, *args):
+            with self.lock:
+                self.calls.append((order_id, name))
+            return Response(not (name == 'post_tag_await_track' and order_id in self.failing))
+
+        fn.__name__ = name
+        return fn
+
+    def forget(self, order_id):
+        with self.lock:
+            self.forgotten.append(order_id)
+
+
+def process(writes, upstream, order_id):
+    # What submissions.accepted() asks for, followed by the pipeline marking the order done
+    writes.post_tag_await_track(order_id)
+    writes.delete_tag_drop_ready(order_id)
+    writes.after(order_id, upstream.forget)
+    writes.done(order_id)
+
+
+# Whatever the flush boundaries and however many orders are worked on at once, an order's changes go out
+# together, and a journal callback given to after() never runs once one of the order's changes has failed
+@pytest.mark.parametrize('batch, num_orders, flush_size, concurrency, seed', [
+    (True, 10, 2, 1, 1),
+    (True, 200, 2, 8, 2),
+    (True, 500, 50, 8, 3),
+    (False, 100, 50, 8, 4),
+])
+def test_changes_stop_at_the_first_failure(monkeypatch, batch, num_orders, flush_size, concurrency, seed):
+    order_ids = [f"O-{i}" for i in range(num_orders)]
+    failing = set(random.Random(seed).sample(order_ids, max(num_orders // 5, 1)))
+    upstream = Upstream(monkeypatch, failing)
+
+    writes = ordoro.MutationBuffer(batch=batch, flush_size=flush_size)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda order_id: process(writes, upstream, order_id), order_ids))
+
+    # A change that comes in after its order failed in an earlier batch (e.g. recovering the submission)
+    for order_id in failing:
+        writes.after(order_id, upstream.forget)
+    writes.flush()
+
+    for order_id in order_ids:
+        names = [call_name for call_id, call_name in upstream.calls if call_id == order_id]
+        if order_id in failing:
+            assert 'delete_tag_drop_ready' not in names, f"{order_id} lost 'Dropship Ready'"
+            assert order_id not in upstream.forgotten, f"{order_id} had its journal entry forgotten"
+        else:
+            assert names == ['post_tag_await_track', 'delete_tag_drop_ready']
+            assert upstream.forgotten.count(order_id) == 1
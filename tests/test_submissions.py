@@ -0,0 +1,132 @@
+import time
+
+import ordoro
+import state
+import submissions
+from order_model import Order
+
+comment_format = 'TAW Order ID: {}'
+
+
+class Writes:
+    """Stand-in for ordoro.MutationBuffer that keeps the changes asked for. Callbacks given to after() run
+    straight away, unless the changes are to fail ('ok' False), in which case they never run."""
+
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.changes = []
+
+    def post_tag_drop_fail(self, order_id):
+        self.changes.append(('post_tag_drop_fail', order_id))
+
+    def post_tag_await_track(self, order_id):
+        self.changes.append(('post_tag_await_track', order_id))
+
+    def delete_tag_drop_ready(self, order_id):
+        self.changes.append(('delete_tag_drop_ready', order_id))
+
+    def post_comment(self, order_id, comment):
+        self.changes.append(('post_comment', order_id, comment))
+
+    def after(self, order_id, fn, *args):
+        if self.ok:
+            fn(order_id, *args)
+
+    def done(self, order_id):
+        pass
+
+
+def order(order_number='M-1-test', tags=(ordoro.tag_drop_ready['name'],), comments=()):
+    return Order(order_number, '2024-01-02T00:00:00.000Z', None, [], list(tags), list(comments), None)
+
+
+def test_start_journals_a_new_order():
+    writes = Writes()
+
+    assert submissions.start(order(), 'taw', writes, comment_format)
+    assert state.get_submission('M-1-test', 'taw') == ('sending', [])
+    assert writes.changes == []
+
+
+def test_start_fails_an_order_left_sending():
+    # An earlier run stopped after journaling the order, it may or may not have reached the supplier
+    state.record_submission('M-1-test', 'taw', 'sending')
+    writes = Writes()
+
+    assert not submissions.start(order(), 'taw', writes, comment_format)
+    assert writes.changes == [('post_tag_drop_fail', 'M-1-test'), ('delete_tag_drop_ready', 'M-1-test')]
+    assert state.get_submission('M-1-test', 'taw') is None
+
+
+def test_start_forgets_an_order_left_sending_that_has_moved_on():
+    state.record_submission('M-1-test', 'taw', 'sending')
+    writes = Writes()
+
+    assert not submissions.start(order(tags=[ordoro.tag_await_track['name']]), 'taw', writes, comment_format)
+    assert writes.changes == []
+    assert state.get_submission('M-1-test', 'taw') is None
+
+
+def test_start_finishes_an_accepted_order_instead_of_sending_it():
+    state.record_submission('M-1-test', 'taw', 'accepted', ['5501'])
+    writes = Writes()
+
+    assert not submissions.start(order(), 'taw', writes, comment_format)
+    assert writes.changes == [
+        ('post_comment', 'M-1-test', 'TAW Order ID: 5501'),
+        ('post_tag_await_track', 'M-1-test'),
+        ('delete_tag_drop_ready', 'M-1-test')]
+    assert state.get_supplier_orders(['M-1-test'], 'taw') == {'M-1-test': ['5501']}
+    assert state.get_submission('M-1-test', 'taw') is None
+
+
+def test_start_only_makes_the_changes_an_accepted_order_is_missing():
+    state.record_submission('M-1-test', 'taw', 'accepted', ['5501'])
+    writes = Writes()
+    accepted_order = order(tags=[ordoro.tag_await_track['name']], comments=['TAW Order ID: 5501'])
+
+    assert not submissions.start(accepted_order, 'taw', writes, comment_format)
+    assert writes.changes == []
+    assert state.get_submission('M-1-test', 'taw') is None
+
+
+def test_start_keeps_an_accepted_order_journaled_until_its_changes_go_through():
+    state.record_submission('M-1-test', 'taw', 'accepted', ['5501'])
+
+    assert not submissions.start(order(), 'taw', Writes(ok=False), comment_format)
+    assert state.get_submission('M-1-test', 'taw') == ('accepted', ['5501'])
+
+
+def test_recover_finishes_entries_from_earlier_runs(monkeypatch):
+    state.record_submission('M-1-test', 'taw', 'sending')
+    state.record_submission('M-2-test', 'taw', 'accepted', ['5502'])
+    time.sleep(0.01)
+    started = time.time()
+    time.sleep(0.01)
+    # Touched by this run, so the submit phase is already dealing with it
+    state.record_submission('M-3-test', 'taw', 'sending')
+
+    orders = {order_number: order(order_number) for order_number in ['M-1-test', 'M-2-test', 'M-3-test']}
+    monkeypatch.setattr(ordoro, 'get_order', orders.get)
+    writes = Writes()
+
+    assert submissions.recover('taw', started, writes, comment_format) == 2
+    assert [change for change in writes.changes if change[1] == 'M-1-test'] == [
+        ('post_tag_drop_fail', 'M-1-test'),
+        ('delete_tag_drop_ready', 'M-1-test')]
+    assert [change for change in writes.changes if change[1] == 'M-2-test'] == [
+        ('post_comment', 'M-2-test', 'TAW Order ID: 5502'),
+        ('post_tag_await_track', 'M-2-test'),
+        ('delete_tag_drop_ready', 'M-2-test')]
+    assert not [change for change in writes.changes if change[1] == 'M-3-test']
+    assert state.get_submission('M-1-test', 'taw') is None
+    assert state.get_submission('M-2-test', 'taw') is None
+    assert state.get_submission('M-3-test', 'taw') == ('sending', [])
+
+
+def test_recover_leaves_entries_for_orders_ordoro_cant_find(monkeypatch):
+    state.record_submission('M-1-test', 'taw', 'accepted', ['5501'])
+    monkeypatch.setattr(ordoro, 'get_order', lambda order_number: None)
+
+    assert submissions.recover('taw', time.time() + 1, Writes(), comment_format) == 0
+    assert state.get_submission('M-1-test', 'taw') == ('accepted', ['5501'])
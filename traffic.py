@@ -0,0 +1,100 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+import requests
+import requests.structures
+
+# Form fields that carry credentials (TAW sends its login with every call). Left out of recordings, headers
+# (Authorization for Ordoro and Meyer) aren't recorded at all.
+secret_fields = ('UserID', 'Password')
+
+# Response headers worth keeping, the pipeline doesn't look at any others
+kept_headers = ('Content-Type', 'Retry-After')
+
+
+def request_key(upstream, request):
+    # What identifies a call across runs: the path and query, plus the body with any credentials taken out.
+    # The host is left out so a recording can be replayed against a different base URL.
+    url = urllib.parse.urlsplit(request.url)
+    body = request.body or b''
+    if isinstance(body, str):
+        body = body.encode()
+
+    content_type = request.headers.get('Content-Type', '')
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        fields = [(key, value) for key, value in urllib.parse.parse_qsl(body.decode(), keep_blank_values=True)
+                  if key not in secret_fields]
+        body = urllib.parse.urlencode(fields).encode()
+
+    return f"{upstream} {request.method} {url.path}?{url.query} {zlib.crc32(body):08x}"
+
+
+class TrafficStore:
+    """
+    Upstream request/response pairs kept in SQLite, so a run can be recorded once against the real services and
+    replayed later with no network. Identical requests are replayed in the order they were recorded (a listing
+    changes as orders move between tags), the last one repeating once they run out.
+    """
+
+    def __init__(self, path):
+        self.__db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__db.execute("""
+            CREATE TABLE IF NOT EXISTS exchange (
+                key TEXT,
+                seq INTEGER,
+                status INTEGER,
+                headers TEXT,
+                content BLOB,
+                elapsed REAL,
+                PRIMARY KEY (key, seq)
+            )""")
+        self.__db.commit()
+
+        self.__replayed = dict()
+        self.__lock = threading.Lock()
+
+    def record(self, upstream, request, response):
+        key = request_key(upstream, request)
+        headers = {name: response.headers[name] for name in kept_headers if name in response.headers}
+
+        with self.__lock:
+            self.__db.execute(
+                "INSERT INTO exchange (key, seq, status, headers, content, elapsed) "
+                "VALUES (?, (SELECT COUNT(*) FROM exchange WHERE key = ?), ?, ?, ?, ?)",
+                (key, key, response.status_code, json.dumps(headers), zlib.compress(response.content),
+                 response.elapsed.total_seconds()))
+            self.__db.commit()
+
+    def replay(self, upstream, request, speed=1.0):
+        # A requests.Response as recorded for the request, after waiting as long as the real call took (divided
+        # by speed, 0 for no wait). None if nothing was recorded for it.
+        key = request_key(upstream, request)
+
+        with self.__lock:
+            seq = self.__replayed.get(key, 0)
+            row = self.__db.execute(
+                "SELECT status, headers, content, elapsed FROM exchange WHERE key = ? AND seq <= ? "
+                "ORDER BY seq DESC LIMIT 1", (key, seq)).fetchone()
+            self.__replayed[key] = seq + 1
+
+        if row is None:
+            return None
+
+        status, headers, content, elapsed = row
+        if speed:
+            time.sleep(elapsed / speed)
+
+        r = requests.Response()
+        r.status_code = status
+        r.headers = requests.structures.CaseInsensitiveDict(json.loads(headers))
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r._content = zlib.decompress(content)
+        r.elapsed = datetime.timedelta(seconds=elapsed)
+        r.url = request.url
+        r.request = request
+        r.reason = 'Replayed'
+        return r
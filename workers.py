@@ -0,0 +1,81 @@
+import concurrent.futures
+import logging
+import threading
+import time
+import metrics
+import shards
+
+logger = logging.getLogger('process-dropships')
+
+__current = threading.local()
+
+
+def current_order():
+    return getattr(__current, 'order_number', None)
+
+
+class OrderLogFilter(logging.Filter):
+    """Prefixes log lines with the order being processed, so interleaved output stays readable."""
+
+    def filter(self, record):
+        order_number = current_order()
+        if order_number is not None:
+            record.msg = f"[{order_number}] {record.msg}"
+        return True
+
+
+logger.addFilter(OrderLogFilter())
+
+
+def run_one(handler, order):
+    if not shards.claim(order.order_number, metrics.current_phase.get()):
+        logger.info(f"Order {order.order_number} is being handled by another runner. Skipping.")
+        return
+
+    __current.order_number = order.order_number
+    started = time.perf_counter()
+    failed = False
+    try:
+        handler(order)
+    except Exception:
+        # One bad order shouldn't take the rest of the run down with it
+        failed = True
+        logger.exception("Unexpected error processing order. Moving on to the next one.\n\r")
+    finally:
+        __current.order_number = None
+        metrics.record_order(time.perf_counter() - started, failed)
+
+
+def run(orders, handler, concurrency=1, phase='none'):
+    # Runs handler over every order, up to 'concurrency' at a time. Returns how many orders were handled.
+    token = metrics.set_phase(phase)
+    try:
+        return __run(orders, handler, concurrency)
+    finally:
+        metrics.reset_phase(token)
+
+
+def __run(orders, handler, concurrency):
+    num_orders = 0
+
+    if concurrency <= 1:
+        for order in orders:
+            num_orders = num_orders + 1
+            run_one(handler, order)
+        return num_orders
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+
+        for order in orders:
+            num_orders = num_orders + 1
+
+            # Only pull more orders off the listing once there's room, so a big backlog isn't held in memory
+            if len(in_flight) >= concurrency * 2:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            in_flight.add(executor.submit(metrics.carry_phase(run_one), handler, order))
+
+        concurrent.futures.wait(in_flight)
+
+    return num_orders